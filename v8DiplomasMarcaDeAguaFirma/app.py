@@ -1,14 +1,16 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
+import queue
+import datetime
 import threading
-from PIL import Image, ImageTk  # Necesario: pip install Pillow
-import requests
-import webbrowser
-from packaging.version import parse
+import multiprocessing
 from utils import resource_path
-import generador
 import mailer
+from trabajo import ControlTrabajo
+
+# Pillow, requests y el generador (reportlab, pandas) se importan donde se usan:
+# la ventana aparece sin esperar a librerías que quizá ni se lleguen a necesitar.
 
 __version__ = "1.0.0" # <-- AÑADIR ESTA LÍNEA
 
@@ -19,7 +21,97 @@ COLOR_PRIMARIO = "#005A9C"    # Azul corporativo (tipo UBU o estándar profesion
 COLOR_SECUNDARIO = "#6C757D"  # Gris para botones secundarios
 COLOR_TEXTO = "#333333"       # Texto casi negro
 
+# --- REGISTRO DE ACTIVIDAD ---
+CARPETA_REGISTROS = os.path.join(os.path.expanduser("~"), ".generador_diplomas", "registros")
+
+class ConsolaRegistro:
+    """
+    Registro de actividad que se puede llamar desde cualquier hilo (una vez por fila).
+    log() solo escribe la línea en el fichero y la deja en una cola; el hilo de la
+    interfaz vacía la cola por lotes cada INTERVALO_MS con una sola inserción en el
+    widget, que guarda solo las últimas MAX_LINEAS. El log completo queda en el fichero,
+    que se cierra con cerrar() al salir.
+    """
+    INTERVALO_MS = 100   # ~10 refrescos por segundo, lleguen 10 o 10.000 líneas
+    MAX_LINEAS = 2000
+
+    def __init__(self, root, widget, carpeta=CARPETA_REGISTROS):
+        self.root = root
+        self.widget = widget
+        self._cola = queue.SimpleQueue()
+        self._lock = threading.Lock()
+
+        # Un fichero por día; si no se puede crear, el registro sigue solo en pantalla
+        self.ruta = None
+        self._fichero = None
+        try:
+            os.makedirs(carpeta, exist_ok=True)
+            self.ruta = os.path.join(carpeta, f"actividad_{datetime.date.today().isoformat()}.log")
+            self._fichero = open(self.ruta, "a", encoding="utf-8")
+        except OSError as e:
+            print(f"No se pudo abrir el fichero de registro: {e}")
+
+        self._tarea = self.root.after(self.INTERVALO_MS, self._vaciar)
+
+    def log(self, mensaje):
+        hora = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            # Tras cerrar() las líneas que lleguen de un hilo que aún termina ya no van al fichero
+            if self._fichero:
+                self._fichero.write(f"{hora} {mensaje}\n")
+        self._cola.put(mensaje)
+
+    def cerrar(self):
+        """Vacía el lote pendiente y cierra el fichero (al cerrar la ventana, antes de destruirla)"""
+        if self._tarea is not None:
+            self.root.after_cancel(self._tarea)
+            self._tarea = None
+            self._vaciar(reprogramar=False)
+        with self._lock:
+            if self._fichero:
+                self._fichero.close()
+                self._fichero = None
+
+    def _vaciar(self, reprogramar=True):
+        lote = []
+        try:
+            while True:
+                lote.append(self._cola.get_nowait())
+        except queue.Empty:
+            pass
+
+        if lote:
+            if self._fichero:
+                with self._lock:
+                    self._fichero.flush()
+
+            # Lo que no va a caber en pantalla ni se inserta
+            texto = "".join(" >> " + m + "\n" for m in lote[-self.MAX_LINEAS:]) # Añadimos flechita visual
+            self.widget.config(state='normal')
+            self.widget.insert(tk.END, texto)
+            lineas = int(self.widget.index("end-1c").split(".")[0]) - 1
+            if lineas > self.MAX_LINEAS:
+                self.widget.delete("1.0", f"{lineas - self.MAX_LINEAS + 1}.0")
+            self.widget.see(tk.END)
+            self.widget.config(state='disabled')
+
+        if reprogramar:
+            self._tarea = self.root.after(self.INTERVALO_MS, self._vaciar)
+
+def formatear_duracion(segundos):
+    """12 s | 3 min 20 s | 1 h 05 min"""
+    segundos = int(round(segundos))
+    if segundos < 60:
+        return f"{segundos} s"
+    minutos, segundos = divmod(segundos, 60)
+    if minutos < 60:
+        return f"{minutos} min {segundos:02d} s"
+    horas, minutos = divmod(minutos, 60)
+    return f"{horas} h {minutos:02d} min"
+
 class AppUnificada:
+    INTERVALO_PROGRESO_MS = 250  # La barra se repinta como mucho 4 veces por segundo
+
     def __init__(self, root):
         self.root = root
         self.root.title("Gestor de Diplomas Oficiales")
@@ -63,6 +155,24 @@ class AppUnificada:
         self.notebook.add(self.tab_env, text="  2. ENVIAR POR OUTLOOK  ")
         self.construir_tab_enviar()
 
+        # PROGRESO DEL TRABAJO EN CURSO (filas, ritmo y tiempo restante)
+        f_progreso = ttk.Frame(main_frame, style="Main.TFrame")
+        f_progreso.pack(fill=tk.X, pady=(10, 0))
+        self.barra_progreso = ttk.Progressbar(f_progreso, mode="determinate")
+        self.barra_progreso.pack(fill=tk.X)
+        f_estado = ttk.Frame(f_progreso, style="Main.TFrame")
+        f_estado.pack(fill=tk.X)
+        self.lbl_progreso = ttk.Label(f_estado, text="", background=COLOR_FONDO, font=("Segoe UI", 9))
+        self.lbl_progreso.pack(side=tk.LEFT)
+        self.btn_cancelar = ttk.Button(f_estado, text="Cancelar", command=self.cancelar_trabajo, state="disabled")
+        self.btn_cancelar.pack(side=tk.RIGHT, pady=(4, 0))
+        self.btn_pausa = ttk.Button(f_estado, text="Pausar", command=self.pausar_trabajo, state="disabled")
+        self.btn_pausa.pack(side=tk.RIGHT, padx=5, pady=(4, 0))
+        self._progreso = None          # Último EventoProgreso recibido (lo escribe el hilo de trabajo)
+        self._progreso_pintado = None
+        self.control = None            # ControlTrabajo del trabajo en marcha (None si no hay ninguno)
+        self.root.after(self.INTERVALO_PROGRESO_MS, self._refrescar_progreso)
+
         # CONSOLA DE REGISTRO
         lbl_log = ttk.Label(main_frame, text="Registro de actividad:", background=COLOR_FONDO, font=("Segoe UI", 9, "bold"))
         lbl_log.pack(anchor="w", pady=(15, 5))
@@ -70,6 +180,10 @@ class AppUnificada:
         self.txt_log = scrolledtext.ScrolledText(main_frame, height=8, state='disabled', 
                                                  font=("Consolas", 9), bg="#FFFFFF", fg="#333333", borderwidth=1, relief="solid")
         self.txt_log.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        self.consola = ConsolaRegistro(self.root, self.txt_log)
+        if self.consola.ruta:
+            self.log(f"📝 Registro completo en: {self.consola.ruta}")
+        self.root.protocol("WM_DELETE_WINDOW", self.cerrar_ventana)
         
         threading.Thread(target=self.check_for_updates, daemon=True).start()
 
@@ -119,6 +233,8 @@ class AppUnificada:
         # LOGO (Redimensionado con Pillow)
         if os.path.exists(self.logo_path):
             try:
+                from PIL import Image, ImageTk  # Necesario: pip install Pillow
+
                 pil_img = Image.open(self.logo_path)
                 # Redimensionar manteniendo proporción (altura 50px)
                 aspect = pil_img.width / pil_img.height
@@ -174,6 +290,23 @@ class AppUnificada:
         ttk.Checkbutton(f_opts, text="Incluir calificación / nota", variable=self.var_calif).grid(row=0, column=1, sticky="w", padx=10, pady=5)
         ttk.Checkbutton(f_opts, text="Incluir campo extra personalizado", variable=self.var_extra).grid(row=0, column=2, sticky="w", padx=10, pady=5)
 
+        # Procesos en paralelo (1 = generación secuencial)
+        f_procesos = ttk.Frame(f_opts, style="White.TFrame")
+        f_procesos.grid(row=1, column=0, sticky="w", padx=10, pady=5)
+        ttk.Label(f_procesos, text="Procesos en paralelo:").pack(side=tk.LEFT)
+        self.var_procesos = tk.IntVar(value=os.cpu_count() or 1)
+        ttk.Spinbox(f_procesos, from_=1, to=max(os.cpu_count() or 1, 1), width=4,
+                    textvariable=self.var_procesos).pack(side=tk.LEFT, padx=5)
+
+        self.var_combinado = tk.BooleanVar(value=False)
+        ttk.Checkbutton(f_opts, text="Un único PDF para imprimir (todas las páginas + índice)", variable=self.var_combinado).grid(row=1, column=1, columnspan=2, sticky="w", padx=10, pady=5)
+
+        self.var_incremental = tk.BooleanVar(value=False)
+        ttk.Checkbutton(f_opts, text="Solo regenerar lo que ha cambiado (incremental)", variable=self.var_incremental).grid(row=2, column=0, columnspan=3, sticky="w", padx=10, pady=5)
+
+        self.var_tiempos_gen = tk.BooleanVar(value=False)
+        ttk.Checkbutton(f_opts, text="Mostrar tiempos por etapa al terminar", variable=self.var_tiempos_gen).grid(row=3, column=0, columnspan=3, sticky="w", padx=10, pady=5)
+
         ttk.Separator(frame, orient="horizontal").pack(fill=tk.X, pady=15)
 
         # SECCIÓN FIRMA DIGITAL
@@ -202,6 +335,14 @@ class AppUnificada:
         self.ent_pass = ttk.Entry(self.f_datos_firma, show="*", width=15) # show="*" oculta caracteres
         self.ent_pass.pack(side=tk.LEFT, padx=5)
 
+        # Pool de firma: se genera en este proceso y se firma en paralelo en otros
+        # (los "Procesos en paralelo" de arriba pasan a ser procesos firmantes)
+        self.f_firma_pool = ttk.Frame(f_firma)
+        self.f_firma_pool.pack(fill=tk.X)
+        self.var_firma_paralela = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.f_firma_pool, text="Firmar en procesos aparte mientras se generan (los procesos en paralelo firman)",
+                        variable=self.var_firma_paralela).pack(anchor="w")
+
         # Estado inicial (desactivado)
         self.toggle_firma()
 
@@ -226,11 +367,14 @@ class AppUnificada:
         f_metodo = ttk.LabelFrame(frame, text=" 1. Elige cómo enviar los correos ", padding=15)
         f_metodo.pack(fill=tk.X, pady=5)
         
-        self.var_metodo_envio = tk.StringVar(value="outlook") # Valor por defecto
+        # Outlook solo se ofrece donde puede funcionar (Windows con pywin32)
+        hay_outlook = mailer.motor_disponible("outlook")
+        self.var_metodo_envio = tk.StringVar(value="outlook" if hay_outlook else "gmail") # Valor por defecto
         
         # Opciones con RadioButton
-        ttk.Radiobutton(f_metodo, text="Usar la aplicación Outlook de mi PC (Recomendado si usas Outlook)", 
-                        variable=self.var_metodo_envio, value="outlook", command=self.actualizar_ui_envio).pack(anchor="w")
+        if hay_outlook:
+            ttk.Radiobutton(f_metodo, text="Usar la aplicación Outlook de mi PC (Recomendado si usas Outlook)", 
+                            variable=self.var_metodo_envio, value="outlook", command=self.actualizar_ui_envio).pack(anchor="w")
         ttk.Radiobutton(f_metodo, text="Usar mi cuenta de Gmail / Google Workspace", 
                         variable=self.var_metodo_envio, value="gmail", command=self.actualizar_ui_envio).pack(anchor="w")
         ttk.Radiobutton(f_metodo, text="Usar mi cuenta de Microsoft 365 / Hotmail / Outlook.com", 
@@ -272,6 +416,14 @@ class AppUnificada:
                                  bg="#FFF3CD", font=("Segoe UI", 10, "bold"), activebackground="#FFF3CD")
         chk_dry.pack(anchor="w")
         
+        # -- Reanudar un envío interrumpido (diario de envíos junto al Excel) --
+        self.var_reanudar = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame, text="Reanudar envío interrumpido (no repetir a quien ya lo recibió)",
+                        variable=self.var_reanudar).pack(anchor="w")
+        self.var_tiempos_env = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame, text="Mostrar tiempos por etapa al terminar",
+                        variable=self.var_tiempos_env).pack(anchor="w")
+
         # -- Botón de Acción --
         self.btn_enviar = ttk.Button(frame, text="📤 ENVIAR CORREOS", style="Accent.TButton", command=self.ejecutar_envio)
         self.btn_enviar.pack(fill=tk.X, pady=20, ipady=8)
@@ -293,10 +445,85 @@ class AppUnificada:
             entry.insert(0, p)
 
     def log(self, mensaje):
-        self.txt_log.config(state='normal')
-        self.txt_log.insert(tk.END, " >> " + mensaje + "\n") # Añadimos flechita visual
-        self.txt_log.see(tk.END)
-        self.txt_log.config(state='disabled')
+        """callback_log de generador y mailer: seguro desde cualquier hilo"""
+        self.consola.log(mensaje)
+
+    def cerrar_ventana(self):
+        """Al cerrar la ventana: se cancela el trabajo en curso y se cierra el registro"""
+        if self.control is not None:
+            self.control.cancelar()
+            self.log("⛔ Ventana cerrada: se cancela el trabajo en curso")
+        self.consola.cerrar()
+        self.root.destroy()
+
+    # --- PROGRESO ---
+    def iniciar_progreso(self):
+        """Deja la barra a cero y prepara el control del trabajo que se va a lanzar (hilo de la interfaz)"""
+        self._progreso = None
+        self._progreso_pintado = None
+        self.barra_progreso.config(value=0, maximum=1)
+        self.lbl_progreso.config(text="Empezando...")
+        self.control = ControlTrabajo()
+        self.btn_pausa.config(text="Pausar", state="normal")
+        self.btn_cancelar.config(state="normal")
+
+    def trabajo_en_marcha(self):
+        if self.control is None:
+            return False
+        messagebox.showwarning("Atención", "Ya hay un trabajo en marcha. Espera a que termine o cancélalo.")
+        return True
+
+    def pausar_trabajo(self):
+        if self.control is None:
+            return
+        if self.control.pausado:
+            self.control.reanudar()
+            self.btn_pausa.config(text="Pausar")
+            self.log("▶️ Continuando...")
+        else:
+            self.control.pausar()
+            self.btn_pausa.config(text="Continuar")
+            self.log("⏸️ En pausa (termina lo que ya estaba en curso).")
+        self._progreso_pintado = None  # Repintar la etiqueta con el estado nuevo
+
+    def cancelar_trabajo(self):
+        if self.control is None or self.control.cancelado:
+            return
+        if messagebox.askyesno("Cancelar", "¿Cancelar el trabajo en curso?\n\nLo ya hecho queda guardado y se puede continuar más tarde."):
+            self.control.cancelar()
+            self.btn_pausa.config(text="Pausar", state="disabled")
+            self.btn_cancelar.config(state="disabled")
+            self.log("⛔ Cancelando: se termina lo que ya estaba en curso...")
+
+    def terminar_trabajo(self):
+        """Lo llama el hilo de trabajo al acabar (con root.after): libera los botones"""
+        self.control = None
+        self.btn_pausa.config(text="Pausar", state="disabled")
+        self.btn_cancelar.config(state="disabled")
+
+    def on_progreso(self, evento):
+        """callback_progreso de generador y mailer: solo guarda el último evento"""
+        self._progreso = evento
+
+    def _refrescar_progreso(self):
+        evento = self._progreso
+        if evento is not None and evento is not self._progreso_pintado:
+            self._progreso_pintado = evento
+            partes = [f"{evento.hechos} / {evento.total}" if evento.total else f"{evento.hechos} filas"]
+            if evento.terminado:
+                partes.append("terminado")
+            elif self.control is not None and self.control.pausado:
+                partes.append("en pausa")
+            else:
+                partes.append(f"{evento.filas_s:.1f} filas/s")
+                if evento.eta_s is not None:
+                    partes.append(f"quedan {formatear_duracion(evento.eta_s)}")
+            if evento.errores:
+                partes.append(f"{evento.errores} errores")
+            self.barra_progreso.config(maximum=evento.total or max(evento.hechos, 1),
+                                       value=evento.hechos if evento.total else 0)
+            self.lbl_progreso.config(text="  ·  ".join(partes))
+        self.root.after(self.INTERVALO_PROGRESO_MS, self._refrescar_progreso)
 
     # --- LOGICA (Conectada igual que antes) ---
     def ejecutar_preview(self):
@@ -307,9 +534,12 @@ class AppUnificada:
         
         opts = (self.var_horas.get(), self.var_calif.get(), self.var_extra.get())
         self.log("--- Generando Vista Previa ---")
+        import generador
         generador.generar_preview(excel, opts, self.logo_path, self.log)
 
     def ejecutar_generacion(self):
+        if self.trabajo_en_marcha():
+            return
         excel_path = self.ent_excel_gen.get()
         if not excel_path:
             messagebox.showwarning("Atención", "Selecciona primero el archivo Excel.")
@@ -349,13 +579,36 @@ class AppUnificada:
 
             datos_firma = (pfx, pwd)
         
+        try:
+            num_procesos = max(1, int(self.var_procesos.get()))
+        except (tk.TclError, ValueError):
+            num_procesos = 1
+        # Con el pool de firma se genera en un solo proceso y los demás firman
+        # (el generador solo usa el pool de firma con num_procesos = 1)
+        procesos_firma = 0
+        if datos_firma and self.var_firma_paralela.get():
+            procesos_firma, num_procesos = num_procesos, 1
+        import generador
+        modo_salida = generador.MODO_COMBINADO if self.var_combinado.get() else generador.MODO_INDIVIDUAL
+        incremental = self.var_incremental.get()
+        medir_tiempos = self.var_tiempos_gen.get()
+
+        self.iniciar_progreso()
         # Pasamos el nombre_firmante al hilo
-        threading.Thread(target=self._hilo_gen, args=(excel_path, out_folder, opts, datos_firma, nombre_firmante)).start()
+        threading.Thread(target=self._hilo_gen, args=(excel_path, out_folder, opts, datos_firma, nombre_firmante, num_procesos, modo_salida, incremental, medir_tiempos, self.control, procesos_firma)).start()
 
     # Actualizamos también la función del hilo para recibir el nuevo argumento
-    def _hilo_gen(self, excel, out, opts, datos_firma=None, nombre_firmante=None):
-        generador.procesar_excel_y_generar(excel, out, opts, self.logo_path, self.log, datos_firma, nombre_firmante)
-        
+    def _hilo_gen(self, excel, out, opts, datos_firma=None, nombre_firmante=None, num_procesos=1, modo_salida=None, incremental=False, medir_tiempos=False, control=None, procesos_firma=0):
+        import generador
+        try:
+            generador.procesar_excel_y_generar(excel, out, opts, self.logo_path, self.log, datos_firma, nombre_firmante, num_procesos, modo_salida, procesos_firma=procesos_firma, incremental=incremental, medir_tiempos=medir_tiempos, callback_progreso=self.on_progreso, control=control)
+        finally:
+            self.root.after(0, self.terminar_trabajo)
+
+        if control is not None and control.cancelado:
+            msg = f"Generación cancelada.\n\nLo generado está en:\n{out}\n\nVuelve a lanzarla con 'Modo incremental' para completar el resto."
+            self.root.after(0, lambda: messagebox.showinfo("Generación Cancelada", msg))
+            return
         msg = f"¡Proceso finalizado!\n\nLos diplomas se han guardado en:\n{out}"
         self.root.after(0, lambda: messagebox.showinfo("Generación Completada", msg))
         try:
@@ -364,6 +617,8 @@ class AppUnificada:
             pass
 
     def ejecutar_envio(self):
+        if self.trabajo_en_marcha():
+            return
         metodo = self.var_metodo_envio.get()
         excel = self.ent_excel_env.get()
         folder = self.ent_dir_pdfs.get()
@@ -372,9 +627,13 @@ class AppUnificada:
             messagebox.showerror("Error", "Faltan rutas (Excel o Carpeta)")
             return
 
+        reanudar = self.var_reanudar.get()
+        medir_tiempos = self.var_tiempos_env.get()
+
         if metodo == "outlook":
             dry = self.var_dryrun.get()
-            threading.Thread(target=self._hilo_envio_outlook, args=(excel, folder, dry)).start()
+            self.iniciar_progreso()
+            threading.Thread(target=self._hilo_envio_outlook, args=(excel, folder, dry, reanudar, medir_tiempos, self.control)).start()
         else:
             # Lógica para SMTP
             user = self.ent_smtp_user.get()
@@ -394,27 +653,47 @@ class AppUnificada:
                     return
                 config = {"server": server, "port": int(port), "tls": True}
             
-            threading.Thread(target=self._hilo_envio_smtp, args=(config, user, pwd, excel, folder)).start()
+            try:
+                conexiones = max(1, int(self.var_smtp_conexiones.get()))
+                ritmo = max(0, int(self.var_smtp_ritmo.get()))
+            except (tk.TclError, ValueError):
+                conexiones, ritmo = 1, 0
 
-    def _hilo_envio_smtp(self, config, user, pwd, excel, folder):
-        mailer.enviar_masivo_smtp(config, user, pwd, excel, folder, self.log)
+            usar_async = self.var_smtp_async.get()
+
+            self.iniciar_progreso()
+            threading.Thread(target=self._hilo_envio_smtp, args=(config, user, pwd, excel, folder, conexiones, ritmo or None, usar_async, reanudar, medir_tiempos, self.control)).start()
+
+    def _hilo_envio_smtp(self, config, user, pwd, excel, folder, conexiones=1, mensajes_por_minuto=None, usar_async=False, reanudar=False, medir_tiempos=False, control=None):
+        try:
+            if usar_async:
+                mailer.enviar_masivo_smtp_async(config, user, pwd, excel, folder, self.log, conexiones, mensajes_por_minuto=mensajes_por_minuto, reanudar=reanudar, medir_tiempos=medir_tiempos, callback_progreso=self.on_progreso, control=control)
+            else:
+                mailer.enviar_masivo_smtp(config, user, pwd, excel, folder, self.log, conexiones, mensajes_por_minuto, reanudar=reanudar, medir_tiempos=medir_tiempos, callback_progreso=self.on_progreso, control=control)
+        finally:
+            self.root.after(0, self.terminar_trabajo)
+        if control is not None and control.cancelado:
+            self.root.after(0, lambda: messagebox.showinfo("Fin", "Envío SMTP cancelado.\n\nMarca 'Reanudar envío interrumpido' para continuar sin repetir."))
+            return
         self.root.after(0, lambda: messagebox.showinfo("Fin", "Proceso de envío SMTP terminado."))
 
-    def _hilo_envio_outlook(self, excel, folder, dry):
-        mailer.enviar_masivo_outlook(excel, folder, dry, self.log)
-        if not dry:
+    def _hilo_envio_outlook(self, excel, folder, dry, reanudar=False, medir_tiempos=False, control=None):
+        try:
+            mailer.enviar_masivo_outlook(excel, folder, dry, self.log, reanudar, medir_tiempos=medir_tiempos, callback_progreso=self.on_progreso, control=control)
+        finally:
+            self.root.after(0, self.terminar_trabajo)
+        if control is not None and control.cancelado:
+            self.log("Envío cancelado. Marca 'Reanudar envío interrumpido' para continuar sin repetir.")
+        elif not dry:
             messagebox.showinfo("Fin", "Envío completado")
         else:
             self.log("Fin de la prueba. Revisa la carpeta Borradores de Outlook.")
             
     # AÑADIR ESTA FUNCIÓN A LA CLASE
     def toggle_firma(self):
-        if self.var_firmar.get():
-            for child in self.f_datos_firma.winfo_children():
-                child.configure(state='normal')
-        else:
-            for child in self.f_datos_firma.winfo_children():
-                child.configure(state='disabled')
+        estado = 'normal' if self.var_firmar.get() else 'disabled'
+        for child in self.f_datos_firma.winfo_children() + self.f_firma_pool.winfo_children():
+            child.configure(state=estado)
 
     # AÑADIR MODIFICACIÓN EN sel_archivo PARA ACEPTAR FILTROS
     def sel_archivo(self, entry, tipos=[("Excel", "*.xlsx")]):
@@ -425,6 +704,11 @@ class AppUnificada:
     
     def check_for_updates(self):
         try:
+            # Se importan aquí: esto corre en un hilo aparte, fuera del arranque
+            import requests
+            import webbrowser
+            from packaging.version import parse
+
             # --- CONFIGURA ESTO ---
             # Reemplaza 'tu_usuario/tu_repositorio' por los tuyos
             repo = "felixdmv/generador-diplomas" 
@@ -470,6 +754,19 @@ class AppUnificada:
             ttk.Label(self.f_smtp_fields, text="Contraseña (o Contraseña de Aplicación si usas 2FA):").pack(anchor="w")
             self.ent_smtp_pass = ttk.Entry(self.f_smtp_fields, show="*")
             self.ent_smtp_pass.pack(fill=tk.X, pady=(2, 10))
+
+            # Rendimiento: conexiones simultáneas y cuota del proveedor
+            f_ritmo = ttk.Frame(self.f_smtp_fields, style="White.TFrame")
+            f_ritmo.pack(fill=tk.X, pady=(0, 10))
+            ttk.Label(f_ritmo, text="Conexiones simultáneas:").pack(side=tk.LEFT)
+            self.var_smtp_conexiones = tk.IntVar(value=1)
+            ttk.Spinbox(f_ritmo, from_=1, to=10, width=4, textvariable=self.var_smtp_conexiones).pack(side=tk.LEFT, padx=5)
+            ttk.Label(f_ritmo, text="Máx. correos/minuto (0 = sin límite):").pack(side=tk.LEFT, padx=(15, 0))
+            self.var_smtp_ritmo = tk.IntVar(value=0)
+            ttk.Spinbox(f_ritmo, from_=0, to=10000, width=6, textvariable=self.var_smtp_ritmo).pack(side=tk.LEFT, padx=5)
+            self.var_smtp_async = tk.BooleanVar(value=False)
+            if mailer.motor_disponible("smtp_async"):  # Solo si está instalado aiosmtplib
+                ttk.Checkbutton(f_ritmo, text="Motor asíncrono (envíos masivos)", variable=self.var_smtp_async).pack(side=tk.LEFT, padx=(15, 0))
             
             # Si es manual, dejamos que el usuario edite servidor/puerto
             if metodo == "manual":
@@ -483,6 +780,9 @@ class AppUnificada:
                 self.ent_smtp_port.pack(fill=tk.X, pady=(2, 10))
 
 if __name__ == "__main__":
+    # Necesario para que el pool de procesos funcione en el .exe de PyInstaller
+    multiprocessing.freeze_support()
+
     # --- TRUCO PARA EL ICONO EN LA BARRA DE TAREAS DE WINDOWS ---
     try:
         from ctypes import windll
@@ -0,0 +1,394 @@
+import io
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import datetime
+import threading
+import subprocess
+import multiprocessing
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4, landscape, portrait
+import generador
+from utils import cargar_configuracion_plantilla
+
+# Banco de pruebas del circuito completo: generar -> firmar -> enviar.
+#
+#   python benchmark.py                       (100, 1.000 y 10.000 filas)
+#   python benchmark.py --filas 100 1000      (solo esos tamaños)
+#   python benchmark.py --etapas generar      (solo alguna etapa)
+#   python benchmark.py --fondos              (comparativa del fondo precargado)
+#   python benchmark.py --arranque            (presupuesto de importación; sale con 1 si se pasa)
+#
+# Todo es local: Excel sintético, certificado de usar y tirar (crear_certificado_test)
+# y el servidor SMTP de pruebas. Cada ejecución se añade a benchmark_resultados.jsonl (local,
+# fuera de git) y se compara con la anterior para que se vea cualquier empeoramiento.
+
+PLANTILLAS = ["default", "curso_biblioteca", "curso_infantil", "curso_vertical"]
+ETAPAS = ["generar", "firmar", "enviar"]
+TAMANOS = [100, 1000, 10000]
+OPCIONES = (True, False, False)
+PASSWORD_PFX = "1234"
+RESULTADOS = "benchmark_resultados.jsonl"
+
+# --- COMPARATIVA DEL FONDO ---
+
+def _pagina(config):
+    if config.get("orientacion", "landscape").lower() == "portrait":
+        return portrait(A4)
+    return landscape(A4)
+
+def _medir(n, config, dibujar):
+    """Genera n PDFs en memoria con solo el fondo y devuelve los ms por diploma"""
+    width, height = _pagina(config)
+    inicio = time.perf_counter()
+    for _ in range(n):
+        c = canvas.Canvas(io.BytesIO(), pagesize=(width, height))
+        dibujar(c, width, height)
+        c.showPage()
+        c.save()
+    return (time.perf_counter() - inicio) * 1000 / n
+
+def medir_fondos(n=50):
+    """Compara drawImage con ruta (decodifica cada vez) frente al fondo precargado"""
+    print(f"Fondo por diploma ({n} diplomas por plantilla):")
+    for nombre in PLANTILLAS:
+        config, ruta_fondo = cargar_configuracion_plantilla(nombre)
+        if not ruta_fondo:
+            continue
+
+        ms_ruta = _medir(n, config, lambda c, w, h: c.drawImage(ruta_fondo, 0, 0, width=w, height=h))
+        generador.limpiar_cache_fondos()
+        ms_cache = _medir(n, config, lambda c, w, h: generador.dibujar_fondo(c, ruta_fondo, w, h))
+
+        print(f"  {nombre:<18} ruta: {ms_ruta:7.2f} ms | precargado: {ms_cache:7.2f} ms | ahorro: {ms_ruta - ms_cache:7.2f} ms ({ms_ruta / ms_cache:.1f}x)")
+
+# --- ARRANQUE EN FRÍO ---
+
+# Punto de entrada -> (ms máximos para importarlo, módulos pesados que no debe cargar)
+PRESUPUESTO_ARRANQUE = {
+    "diplomas": (100, ["tkinter", "PIL", "requests", "pandas", "reportlab", "pyhanko", "cryptography"]),
+    "firmador": (50, ["pyhanko", "cryptography"]),
+    "mailer": (200, ["pandas", "pyhanko", "reportlab", "aiosmtplib", "win32com"]),
+    "generador": (500, ["pandas", "pyhanko", "cryptography"]),
+    "app": (300, ["PIL", "requests", "pandas", "reportlab", "pyhanko", "cryptography"]),
+}
+REPETICIONES_ARRANQUE = 5
+
+_MEDIR_IMPORT = """
+import sys, json, time
+t = time.perf_counter()
+import {modulo}
+ms = (time.perf_counter() - t) * 1000
+print(json.dumps({{"ms": ms, "cargados": [m for m in {prohibidos!r} if m in sys.modules]}}))
+"""
+
+def medir_arranque(modulo, prohibidos):
+    """Importa 'modulo' en un intérprete nuevo; devuelve (ms, módulos prohibidos cargados) o None si falla"""
+    codigo = _MEDIR_IMPORT.format(modulo=modulo, prohibidos=prohibidos)
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True)
+    if salida.returncode != 0:
+        return None
+    r = json.loads(salida.stdout.strip().splitlines()[-1])
+    return r["ms"], r["cargados"]
+
+def comprobar_arranque():
+    """Mide cada punto de entrada (mediana de varias veces) contra su presupuesto. True si todo cabe"""
+    print(f"Importación en frío (mediana de {REPETICIONES_ARRANQUE}):")
+    correcto = True
+    for modulo, (limite, prohibidos) in PRESUPUESTO_ARRANQUE.items():
+        medidas = [medir_arranque(modulo, prohibidos) for _ in range(REPETICIONES_ARRANQUE)]
+        if None in medidas:
+            print(f"  {modulo:<10}       -   (no se puede importar aquí, p.ej. falta tkinter)")
+            continue
+        ms = sorted(m for m, _ in medidas)[len(medidas) // 2]
+        cargados = sorted({c for _, lista in medidas for c in lista})
+        problemas = []
+        if ms > limite:
+            problemas.append(f"supera {limite} ms")
+        if cargados:
+            problemas.append("carga " + ", ".join(cargados))
+        correcto = correcto and not problemas
+        estado = "⚠️ " + "; ".join(problemas) if problemas else "✅"
+        print(f"  {modulo:<10} {ms:7.1f} ms / {limite:>4} ms  {estado}")
+    return correcto
+
+# --- DATOS SINTÉTICOS ---
+
+NOMBRES = ["Félix", "Alejandro", "María José", "Lucía", "Íñigo", "Carmen", "Juan Pablo", "Ana Belén"]
+APELLIDOS = ["de Miguel", "Martínez", "López", "García-Herrero", "Fernández de la Torre", "Núñez", "Villalba", "Ruiz"]
+CURSOS = [
+    "Normas APA",
+    "Gestión de referencias bibliográficas",
+    "Búsqueda avanzada de información científica",
+    "Curso de especialización en gestión de repositorios institucionales y datos de investigación abiertos",
+]
+
+def crear_excel_sintetico(ruta, filas):
+    """Excel con las columnas del ejemplo, repartiendo las filas entre todas las plantillas"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["alumno_id", "nombre", "apellido1", "apellido2", "email", "curso_id",
+               "curso_nombre", "id_plantilla", "fecha", "horas", "calificacion_num",
+               "calificacion_texto", "extra_1", "extra_2"])
+    for n in range(filas):
+        curso = n % len(CURSOS)
+        ws.append([
+            n + 1,
+            NOMBRES[n % len(NOMBRES)],
+            APELLIDOS[n % len(APELLIDOS)],
+            APELLIDOS[(n // len(APELLIDOS)) % len(APELLIDOS)],
+            f"alumno{n:05d}@ejemplo.es",
+            f"curso_{curso}",
+            CURSOS[curso],
+            PLANTILLAS[n % len(PLANTILLAS)],
+            datetime.date(2026, 1, 1 + n % 28),
+            10 + n % 30,
+            round(5 + (n % 50) / 10, 1),
+            "Apto",
+            None,
+            None,
+        ])
+    wb.save(ruta)
+
+# --- MEDICIÓN ---
+
+def percentil(valores, p):
+    """Percentil p (0-100) por el método del rango más cercano"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[k]
+
+def memoria_maxima_mb():
+    """Pico de memoria (RSS) de este proceso en MB, o None si no se puede saber"""
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux lo da en KB, macOS en bytes
+        return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+class _Cronometro:
+    """
+    callback_log que apunta cuándo sale cada línea que empieza por 'prefijo': el
+    tiempo desde la línea anterior del log es lo que ha tardado esa fila (motor de
+    una sola conexión / un solo proceso, así que salen de una en una; los preparativos
+    del principio acaban en otras líneas y no cuentan)
+    """
+    def __init__(self, prefijo):
+        self.prefijo = prefijo
+        self.latencias = []
+        self.errores = []
+        self._ultima = time.perf_counter()
+
+    def __call__(self, mensaje):
+        ahora = time.perf_counter()
+        if mensaje.startswith(self.prefijo):
+            self.latencias.append(ahora - self._ultima)
+        elif "ERROR" in mensaje or mensaje.startswith("❌"):
+            self.errores.append(mensaje)
+        self._ultima = ahora
+
+def _etapa_generar(excel, carpeta):
+    # El mismo punto de entrada que la interfaz y la línea de comandos (un proceso)
+    pdfs = os.path.join(carpeta, "pdfs")
+    cronometro = _Cronometro("Generado:")
+    generados, errores = generador.procesar_excel_y_generar(
+        excel, pdfs, OPCIONES, None, cronometro, nombre_firmante="Pruebas Generador Diplomas", num_procesos=1)
+    if errores:
+        raise RuntimeError(f"{errores} filas con error al generar: {cronometro.errores[:1]}")
+    total_bytes = sum(os.path.getsize(os.path.join(pdfs, n)) for n in os.listdir(pdfs) if n.endswith(".pdf"))
+    return cronometro.latencias, total_bytes
+
+def _etapa_firmar(excel, carpeta):
+    # Firma en memoria con la sesión de firma cacheada, como hace el generador
+    import firmador
+
+    pdfs = os.path.join(carpeta, "pdfs")
+    pfx = os.path.join(carpeta, "certificado_benchmark.pfx")
+    latencias, total_bytes = [], 0
+    for nombre in sorted(n for n in os.listdir(pdfs) if n.endswith(".pdf")):
+        ruta = os.path.join(pdfs, nombre)
+        with open(ruta, "rb") as f:
+            contenido = f.read()
+        t = time.perf_counter()
+        firmado = firmador.firmar_bytes(contenido, pfx, PASSWORD_PFX)
+        if not firmado:
+            raise RuntimeError(f"No se pudo firmar {nombre}")
+        with open(ruta, "wb") as f:
+            f.write(firmado)
+        latencias.append(time.perf_counter() - t)
+        total_bytes += len(firmado)
+    return latencias, total_bytes
+
+def _etapa_enviar(excel, carpeta):
+    # El motor SMTP de la aplicación (una conexión) contra el servidor de pruebas
+    import mailer
+    from servidor_smtp_prueba import ServidorSMTPPrueba
+
+    # Servidor SMTP de pruebas en su propio hilo (no guarda los emails)
+    bucle = asyncio.new_event_loop()
+    servidor = bucle.run_until_complete(ServidorSMTPPrueba(puerto=0).iniciar())
+    threading.Thread(target=bucle.run_forever, daemon=True).start()
+
+    pdfs = os.path.join(carpeta, "pdfs")
+    cronometro = _Cronometro("🚀 [ENVIADO SMTP]")
+    try:
+        resultado = mailer.enviar_masivo_smtp({"server": "127.0.0.1", "port": servidor.puerto, "tls": False},
+                                              "benchmark@ejemplo.es", "x", excel, pdfs, cronometro)
+    finally:
+        asyncio.run_coroutine_threadsafe(servidor.detener(), bucle).result()
+        bucle.call_soon_threadsafe(bucle.stop)
+    if resultado is None:
+        raise RuntimeError(f"No se pudo conectar: {cronometro.errores[:1]}")
+    if resultado[1]:
+        raise RuntimeError(f"{resultado[1]} envíos con error: {cronometro.errores[:1]}")
+    return cronometro.latencias, servidor.bytes_recibidos
+
+_FUNCIONES_ETAPA = {"generar": _etapa_generar, "firmar": _etapa_firmar, "enviar": _etapa_enviar}
+
+def _ejecutar_etapa(etapa, excel, carpeta, cola):
+    """Proceso hijo: una etapa en un proceso limpio, así el pico de memoria es solo suyo"""
+    try:
+        inicio = time.perf_counter()
+        latencias, total_bytes = _FUNCIONES_ETAPA[etapa](excel, carpeta)
+        duracion = time.perf_counter() - inicio
+        cola.put({
+            "filas_s": len(latencias) / duracion if duracion else 0.0,
+            "p50_ms": percentil(latencias, 50) * 1000,
+            "p99_ms": percentil(latencias, 99) * 1000,
+            "rss_mb": memoria_maxima_mb(),
+            "bytes": total_bytes,
+            "segundos": duracion,
+        })
+    except Exception as e:
+        cola.put({"error": str(e)})
+
+def medir_etapa(etapa, excel, carpeta):
+    cola = multiprocessing.Queue()
+    proceso = multiprocessing.Process(target=_ejecutar_etapa, args=(etapa, excel, carpeta, cola))
+    proceso.start()
+    while True:
+        try:
+            resultado = cola.get(timeout=1)
+            break
+        except queue.Empty:
+            if proceso.exitcode is None:
+                continue
+            # El hijo ha muerto sin dejar resultado (p.ej. un fallo de memoria): no esperar para siempre
+            try:
+                resultado = cola.get(timeout=1)
+            except queue.Empty:
+                resultado = {"error": f"el proceso de la etapa terminó sin resultado (código {proceso.exitcode})"}
+            break
+    proceso.join()
+    return resultado
+
+# --- RESULTADOS ---
+
+def _version_codigo():
+    try:
+        salida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10)
+        return salida.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def leer_resultados_anteriores():
+    """Última medición guardada de cada (etapa, filas)"""
+    anteriores = {}
+    if not os.path.exists(RESULTADOS):
+        return anteriores
+    with open(RESULTADOS, "r", encoding="utf-8") as f:
+        for linea in f:
+            try:
+                r = json.loads(linea)
+            except ValueError:
+                continue
+            if "error" not in r:
+                anteriores[(r["etapa"], r["filas"])] = r
+    return anteriores
+
+def guardar_resultados(resultados):
+    with open(RESULTADOS, "a", encoding="utf-8") as f:
+        for r in resultados:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+def imprimir_fila(r, anterior):
+    if "error" in r:
+        print(f"  {r['etapa']:<8} {r['filas']:>7}   ❌ {r['error']}")
+        return
+    rss = f"{r['rss_mb']:8.1f}" if r["rss_mb"] is not None else "       -"
+    cambio = ""
+    if anterior:
+        delta = (r["filas_s"] - anterior["filas_s"]) / anterior["filas_s"] * 100
+        cambio = f"{delta:+6.1f}%" + ("  ⚠️" if delta < -10 else "")
+    print(f"  {r['etapa']:<8} {r['filas']:>7} {r['filas_s']:9.1f} {r['p50_ms']:8.2f} {r['p99_ms']:8.2f} "
+          f"{rss} {r['bytes'] / (1024 * 1024):9.2f}  {cambio}")
+
+def ejecutar_benchmark(tamanos=TAMANOS, etapas=ETAPAS):
+    from crear_certificado_test import generar_pfx_prueba
+
+    anteriores = leer_resultados_anteriores()
+    comun = {
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "version": _version_codigo(),
+        "python": platform.python_version(),
+        "sistema": platform.platform(),
+    }
+    resultados = []
+
+    print(f"  {'etapa':<8} {'filas':>7} {'filas/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>8} {'MB salida':>9}  vs anterior")
+    for filas in tamanos:
+        carpeta = tempfile.mkdtemp(prefix=f"bench_{filas}_")
+        try:
+            excel = os.path.join(carpeta, "alumnos.xlsx")
+            crear_excel_sintetico(excel, filas)
+            if "firmar" in etapas:
+                generar_pfx_prueba(os.path.join(carpeta, "certificado_benchmark.pfx"), PASSWORD_PFX.encode("utf-8"))
+
+            # firmar y enviar necesitan los PDFs, así que generar se ejecuta siempre (primero)
+            for etapa in ETAPAS:
+                if etapa not in etapas and etapa != "generar":
+                    continue
+                r = dict(comun, etapa=etapa, filas=filas, **medir_etapa(etapa, excel, carpeta))
+                if etapa in etapas:
+                    resultados.append(r)
+                    imprimir_fila(r, anteriores.get((etapa, filas)))
+        finally:
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+    guardar_resultados(resultados)
+    print(f"Resultados añadidos a {RESULTADOS}")
+
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Banco de pruebas: generar -> firmar -> enviar")
+    parser.add_argument("--filas", type=int, nargs="+", default=TAMANOS, help="Tamaños de Excel a probar")
+    parser.add_argument("--etapas", nargs="+", choices=ETAPAS, default=ETAPAS, help="Etapas a medir")
+    parser.add_argument("--fondos", action="store_true", help="Solo la comparativa del fondo precargado")
+    parser.add_argument("--arranque", action="store_true", help="Solo el presupuesto de importación en frío")
+    args = parser.parse_args()
+
+    if args.arranque:
+        sys.exit(0 if comprobar_arranque() else 1)
+    elif args.fondos:
+        medir_fondos()
+    else:
+        ejecutar_benchmark(args.filas, args.etapas)
@@ -7,7 +7,7 @@ from cryptography import x509
 import datetime
 import os
 
-def generar_pfx_prueba():
+def generar_pfx_prueba(ruta_salida="certificado_prueba.pfx", password=b"1234"):
     print("Generando certificado de prueba...")
     
     # 1. Crear clave privada
@@ -44,8 +44,7 @@ def generar_pfx_prueba():
     ).sign(key, hashes.SHA256())
 
     # 4. Guardar como .pfx
-    # Contraseña para el archivo: "1234"
-    password = b"1234"
+    # Contraseña para el archivo: "1234" (salvo que se pida otra)
     
     # USAMOS pkcs12 DIRECTAMENTE
     pfx_data = pkcs12.serialize_key_and_certificates(
@@ -56,11 +55,11 @@ def generar_pfx_prueba():
         encryption_algorithm=serialization.BestAvailableEncryption(password)
     )
 
-    with open("certificado_prueba.pfx", "wb") as f:
+    with open(ruta_salida, "wb") as f:
         f.write(pfx_data)
         
-    print("✅ ¡Éxito! Se ha creado 'certificado_prueba.pfx'")
-    print("🔑 La contraseña es: 1234")
+    print(f"✅ ¡Éxito! Se ha creado '{ruta_salida}'")
+    print(f"🔑 La contraseña es: {password.decode('utf-8')}")
 
 if __name__ == "__main__":
     generar_pfx_prueba()
\ No newline at end of file
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import datetime
+
+# Estados de cada destinatario en el diario
+ENVIANDO = "enviando"   # Se entregó al servidor pero aún no hay confirmación
+ENVIADO = "enviado"
+ERROR = "error"
+
+def ruta_diario(excel_path):
+    """El diario se guarda junto al Excel: alumnos.xlsx -> alumnos.envios.sqlite"""
+    return os.path.splitext(excel_path)[0] + ".envios.sqlite"
+
+class DiarioEnvios:
+    """
+    Registro persistente (SQLite) del estado de envío de cada destinatario de un Excel.
+    Cada cambio de estado se confirma al momento (commit), así que si el envío se
+    interrumpe (conexión caída, portátil suspendido, cierre de la app...) el diario
+    sabe exactamente quién tiene ya su email.
+
+    reanudar=True  -> se salta a quien ya figura como enviado.
+    reanudar=False -> envío nuevo: se vacía el diario y se empieza de cero.
+    Se usa siempre desde un único hilo (el que recoge los resultados).
+    """
+    def __init__(self, excel_path, reanudar=False):
+        self.ruta = ruta_diario(excel_path)
+        self.reanudar = reanudar
+        self._db = sqlite3.connect(self.ruta)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS envios (
+                   clave TEXT PRIMARY KEY,
+                   fila INTEGER,
+                   email TEXT,
+                   curso TEXT,
+                   estado TEXT NOT NULL,
+                   intentos INTEGER NOT NULL DEFAULT 0,
+                   error TEXT,
+                   fecha TEXT
+               )"""
+        )
+        self._db.commit()
+
+        # Estado de la ejecución anterior (para saltar o avisar)
+        self.previos = dict(self._db.execute("SELECT clave, estado FROM envios"))
+        if not reanudar and self.previos:
+            with self._db:
+                self._db.execute("DELETE FROM envios")
+
+    def contar(self, estado):
+        """Cuántos destinatarios de la ejecución anterior estaban en ese estado"""
+        return sum(1 for e in self.previos.values() if e == estado)
+
+    def ya_enviado(self, fila):
+        return self.reanudar and self.previos.get(fila.archivo) == ENVIADO
+
+    def dudoso(self, fila):
+        """Se cortó justo mientras se enviaba: no se sabe si llegó"""
+        return self.reanudar and self.previos.get(fila.archivo) == ENVIANDO
+
+    def _guardar(self, fila, estado, error=None):
+        with self._db:  # Transacción: commit al salir (o rollback si falla)
+            self._db.execute(
+                """INSERT INTO envios (clave, fila, email, curso, estado, intentos, error, fecha)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(clave) DO UPDATE SET
+                       fila = excluded.fila,
+                       estado = excluded.estado,
+                       intentos = envios.intentos + excluded.intentos,
+                       error = excluded.error,
+                       fecha = excluded.fecha""",
+                (fila.archivo, fila.i + 2, fila.email, fila.curso, estado,
+                 1 if estado == ENVIANDO else 0, error,
+                 datetime.datetime.now().isoformat(timespec="seconds"))
+            )
+
+    def enviando(self, fila):
+        self._guardar(fila, ENVIANDO)
+
+    def enviado(self, fila):
+        self._guardar(fila, ENVIADO)
+
+    def error(self, fila, error):
+        self._guardar(fila, ERROR, str(error))
+
+    def cerrar(self):
+        self._db.close()
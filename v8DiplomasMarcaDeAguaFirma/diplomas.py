@@ -0,0 +1,448 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import getpass
+import signal
+import logging
+from contextlib import redirect_stdout, contextmanager
+
+# Ejecución sin interfaz gráfica (servidores, tareas programadas con cron):
+#
+#   python -m diplomas generate alumnos.xlsx [--salida carpeta] [--pfx cert.pfx] [--incremental]
+#   python -m diplomas sign     carpeta_o_pdfs... --pfx cert.pfx
+#   python -m diplomas send     alumnos.xlsx carpeta_pdfs --proveedor gmail --usuario yo@gmail.com
+#   python -m diplomas verify   carpeta_o_pdfs... [--pfx cert.pfx]
+#
+# Las contraseñas se pasan por variable de entorno (DIPLOMAS_PFX_PASSWORD,
+# DIPLOMAS_SMTP_PASSWORD) o se piden por teclado. Con --json cada línea de la salida
+# es un objeto JSON ({"evento": "log" | "progreso" | "archivo" | "fin", ...}).
+# No se importa nada de la interfaz (tkinter, PIL, requests) y los módulos pesados
+# (reportlab, pandas, pyhanko...) solo los carga el subcomando que los necesita.
+#
+# En generate y send, Ctrl+C (o SIGTERM) cancela de forma ordenada: se termina lo que
+# ya estaba en curso, lo hecho queda en el manifiesto / diario de envíos y se sale con
+# 130; relanzando con --incremental / --reanudar se sigue donde se paró. Un segundo
+# Ctrl+C corta en el acto.
+
+# Códigos de salida
+SALIDA_OK = 0
+SALIDA_ERRORES = 1         # Terminó, pero alguna fila o archivo falló
+SALIDA_USO = 2             # Argumentos o rutas incorrectos (el mismo que usa argparse)
+SALIDA_FALLO = 3           # No se pudo hacer el trabajo (login SMTP, certificado, error inesperado...)
+SALIDA_INTERRUMPIDO = 130  # Ctrl+C / SIGTERM
+
+ENV_PASSWORD_PFX = "DIPLOMAS_PFX_PASSWORD"
+ENV_PASSWORD_SMTP = "DIPLOMAS_SMTP_PASSWORD"
+
+class Salida:
+    """Progreso por la salida estándar: texto legible o una línea JSON por evento"""
+    def __init__(self, como_json=False, flujo=None):
+        self.json = como_json
+        self.flujo = flujo or sys.stdout
+        self.inicio = time.perf_counter()
+
+    def evento(self, tipo, **datos):
+        if self.json:
+            registro = {"evento": tipo, "t": round(time.perf_counter() - self.inicio, 3), **datos}
+            self.flujo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            self.flujo.flush()
+
+    def log(self, mensaje):
+        """Se usa como callback_log de generador y mailer"""
+        if self.json:
+            self.evento("log", mensaje=mensaje)
+        else:
+            self.flujo.write(f"{mensaje}\n")
+            self.flujo.flush()
+
+    def progreso(self, evento):
+        """callback_progreso: con --json, un evento por aviso (unas pocas veces por segundo)"""
+        eta_s = round(evento.eta_s, 1) if evento.eta_s is not None else None
+        self.evento("progreso", hechos=evento.hechos, total=evento.total, errores=evento.errores,
+                    filas_s=round(evento.filas_s, 2), eta_s=eta_s, terminado=evento.terminado)
+
+    def fin(self, codigo, **totales):
+        self.evento("fin", codigo=codigo, **totales)
+        return codigo
+
+def _password(args, variable, descripcion):
+    """--password, si no la variable de entorno, y si no se pregunta (solo en una terminal)"""
+    if args.password is not None:
+        return args.password
+    if os.environ.get(variable) is not None:
+        return os.environ[variable]
+    if sys.stdin.isatty():
+        return getpass.getpass(f"Contraseña {descripcion}: ")
+    return None
+
+def _buscar_pdfs(rutas):
+    """Los PDFs indicados, y los de primer nivel de cada carpeta indicada"""
+    pdfs = []
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            pdfs.extend(os.path.join(ruta, n) for n in sorted(os.listdir(ruta)) if n.lower().endswith(".pdf"))
+        elif os.path.isfile(ruta):
+            pdfs.append(ruta)
+    return pdfs
+
+def _abrir_certificado(args, salida):
+    """(SesionFirma, contraseña) del --pfx, o (None, None) si no se puede abrir (ya avisado por el log)"""
+    if not os.path.exists(args.pfx):
+        salida.log(f"❌ No existe el certificado {args.pfx}")
+        return None, None
+    password = _password(args, ENV_PASSWORD_PFX, "del certificado")
+    if password is None:
+        salida.log(f"❌ Falta la contraseña del certificado (--password o {ENV_PASSWORD_PFX}).")
+        return None, None
+
+    import firmador
+    try:
+        sesion = firmador.obtener_sesion(args.pfx, password)
+    except Exception as e:
+        salida.log(f"❌ No se pudo abrir el certificado: {e}")
+        return None, None
+    salida.log(f"🔑 Certificado: {sesion.nombre_firmante}")
+    return sesion, password
+
+@contextmanager
+def _cancelable(salida):
+    """ControlTrabajo que se cancela con Ctrl+C / SIGTERM mientras dura el bloque"""
+    from trabajo import ControlTrabajo
+    control = ControlTrabajo()
+
+    def al_recibir(signum, frame):
+        if control.cancelado:
+            raise KeyboardInterrupt
+        control.cancelar()
+        salida.log("⛔ Cancelando: se termina lo que ya estaba en curso (Ctrl+C otra vez para salir ya)...")
+
+    anteriores = {}
+    for nombre in ("SIGINT", "SIGTERM"):
+        senal = getattr(signal, nombre, None)
+        if senal is None:
+            continue
+        try:
+            anteriores[senal] = signal.signal(senal, al_recibir)
+        except ValueError:
+            pass  # Fuera del hilo principal (main() llamado desde otro programa): sin señales
+    try:
+        yield control
+    finally:
+        for senal, anterior in anteriores.items():
+            signal.signal(senal, anterior)
+
+# --- SUBCOMANDOS ---
+
+def cmd_generar(args, salida):
+    if not os.path.exists(args.excel):
+        salida.log(f"❌ No se encuentra el Excel {args.excel}")
+        return salida.fin(SALIDA_USO)
+
+    # Los dos modos paralelos no se combinan: con --procesos > 1 el generador no usa el pool de firma
+    if args.procesos_firma and args.procesos is not None and args.procesos > 1:
+        salida.log("❌ --procesos-firma no se puede combinar con --procesos mayor que 1.")
+        return salida.fin(SALIDA_USO)
+    if args.procesos is None:
+        args.procesos = 1 if args.procesos_firma else (os.cpu_count() or 1)
+
+    import generador
+    from utils import resource_path
+
+    datos_firma = None
+    nombre_firmante = args.firmante
+    if args.pfx:
+        sesion, password = _abrir_certificado(args, salida)
+        if sesion is None:
+            return salida.fin(SALIDA_FALLO)
+        datos_firma = (args.pfx, password)
+        nombre_firmante = nombre_firmante or sesion.nombre_firmante
+
+    salida_pdfs = args.salida or os.path.join(os.path.dirname(os.path.abspath(args.excel)), "Diplomas_Generados")
+    opciones = (not args.sin_horas, args.calificacion, args.extra)
+    modo_salida = generador.MODO_COMBINADO if args.combinado else generador.MODO_INDIVIDUAL
+    logo_path = resource_path(os.path.join("imgs", "ubu_logo.png"))
+
+    with _cancelable(salida) as control:
+        generados, errores = generador.procesar_excel_y_generar(
+            args.excel, salida_pdfs, opciones, logo_path, salida.log, datos_firma, nombre_firmante,
+            args.procesos, modo_salida, procesos_firma=args.procesos_firma, incremental=args.incremental,
+            medir_tiempos=args.tiempos, ruta_metricas=args.metricas, callback_progreso=salida.progreso,
+            control=control)
+    if control.cancelado:
+        codigo = SALIDA_INTERRUMPIDO
+    else:
+        codigo = SALIDA_ERRORES if errores else SALIDA_OK
+    return salida.fin(codigo, generados=generados, errores=errores, carpeta=salida_pdfs)
+
+def cmd_firmar(args, salida):
+    pdfs = _buscar_pdfs(args.rutas)
+    if not pdfs:
+        salida.log("❌ No hay PDFs que firmar.")
+        return salida.fin(SALIDA_USO)
+
+    sesion, _ = _abrir_certificado(args, salida)
+    if sesion is None:
+        return salida.fin(SALIDA_FALLO)
+
+    import hashlib
+    from pyhanko.pdf_utils.reader import PdfFileReader
+    from manifiesto import Manifiesto, ruta_manifiesto
+
+    firmados = 0
+    saltados = 0
+    errores = 0
+    manifiestos = {}  # carpeta -> Manifiesto (solo las que ya tienen uno)
+    try:
+        for ruta in pdfs:
+            archivo = os.path.basename(ruta)
+            try:
+                with open(ruta, "rb") as f:
+                    contenido = f.read()
+                if not args.refirmar and PdfFileReader(io.BytesIO(contenido)).embedded_signatures:
+                    saltados += 1
+                    salida.evento("archivo", archivo=ruta, estado="ya_firmado")
+                    continue
+
+                contenido = sesion.firmar_bytes(contenido)
+                with open(ruta + ".signed.tmp", "wb") as f:
+                    f.write(contenido)
+                os.replace(ruta + ".signed.tmp", ruta)
+            except Exception as e:
+                errores += 1
+                salida.log(f"[ERROR] {ruta}: {e}")
+                salida.evento("archivo", archivo=ruta, estado="error", error=str(e))
+                continue
+
+            # El PDF ha cambiado: se actualiza su entrada del manifiesto del generador
+            carpeta = os.path.dirname(os.path.abspath(ruta))
+            if carpeta not in manifiestos and os.path.exists(ruta_manifiesto(carpeta)):
+                manifiestos[carpeta] = Manifiesto(carpeta)
+            manifiesto = manifiestos.get(carpeta)
+            if manifiesto is not None and archivo in manifiesto.previas:
+                entrada = dict(manifiesto.previas[archivo], bytes=len(contenido), firmado=True,
+                               sha256=hashlib.sha256(contenido).hexdigest())
+                entrada.pop("huella", None)  # La firma ya no es la que recuerda el modo incremental
+                manifiesto.registrar(entrada)
+
+            firmados += 1
+            salida.log(f"✍️ Firmado: {ruta}")
+            salida.evento("archivo", archivo=ruta, estado="firmado")
+    finally:
+        for manifiesto in manifiestos.values():
+            manifiesto.cerrar()
+
+    if saltados:
+        salida.log(f"FIN. Firmados: {firmados} | Ya firmados: {saltados} | Errores: {errores}")
+    else:
+        salida.log(f"FIN. Firmados: {firmados} | Errores: {errores}")
+    return salida.fin(SALIDA_ERRORES if errores else SALIDA_OK, firmados=firmados, ya_firmados=saltados,
+                      errores=errores)
+
+def cmd_enviar(args, salida):
+    if not os.path.exists(args.excel):
+        salida.log(f"❌ No se encuentra el Excel {args.excel}")
+        return salida.fin(SALIDA_USO)
+    if not os.path.isdir(args.carpeta_pdfs):
+        salida.log(f"❌ No existe la carpeta de PDFs {args.carpeta_pdfs}")
+        return salida.fin(SALIDA_USO)
+
+    import mailer
+
+    if args.proveedor == "outlook":
+        with _cancelable(salida) as control:
+            resultado = mailer.enviar_masivo_outlook(args.excel, args.carpeta_pdfs, args.prueba, salida.log,
+                                                     args.reanudar, medir_tiempos=args.tiempos,
+                                                     ruta_metricas=args.metricas, callback_progreso=salida.progreso,
+                                                     control=control)
+    else:
+        if args.proveedor == "manual":
+            if not args.servidor:
+                salida.log("❌ Con --proveedor manual hace falta --servidor.")
+                return salida.fin(SALIDA_USO)
+            config = {"server": args.servidor, "port": args.puerto, "tls": not args.sin_tls}
+        else:
+            config = mailer.SMTP_PROVIDERS[args.proveedor]
+
+        if not args.usuario:
+            salida.log("❌ Falta el usuario SMTP (--usuario).")
+            return salida.fin(SALIDA_USO)
+        password = _password(args, ENV_PASSWORD_SMTP, f"SMTP de {args.usuario}")
+        if password is None:
+            salida.log(f"❌ Falta la contraseña SMTP (--password o {ENV_PASSWORD_SMTP}).")
+            return salida.fin(SALIDA_USO)
+
+        ritmo = args.ritmo or None
+        with _cancelable(salida) as control:
+            if args.asincrono:
+                resultado = mailer.enviar_masivo_smtp_async(
+                    config, args.usuario, password, args.excel, args.carpeta_pdfs, salida.log,
+                    args.conexiones, args.reintentos, ritmo, args.reanudar,
+                    medir_tiempos=args.tiempos, ruta_metricas=args.metricas, callback_progreso=salida.progreso,
+                    control=control)
+            else:
+                resultado = mailer.enviar_masivo_smtp(
+                    config, args.usuario, password, args.excel, args.carpeta_pdfs, salida.log,
+                    args.conexiones, ritmo, args.reanudar,
+                    medir_tiempos=args.tiempos, ruta_metricas=args.metricas, callback_progreso=salida.progreso,
+                    control=control)
+
+    if resultado is None:
+        return salida.fin(SALIDA_INTERRUMPIDO if control.cancelado else SALIDA_FALLO)
+    enviados, errores = resultado
+    if control.cancelado:
+        codigo = SALIDA_INTERRUMPIDO
+    else:
+        codigo = SALIDA_ERRORES if errores else SALIDA_OK
+    return salida.fin(codigo, enviados=enviados, errores=errores)
+
+def cmd_verificar(args, salida):
+    pdfs = _buscar_pdfs(args.rutas)
+    if not pdfs:
+        salida.log("❌ No hay PDFs que verificar.")
+        return salida.fin(SALIDA_USO)
+
+    confianza = None
+    if args.pfx:
+        sesion, _ = _abrir_certificado(args, salida)
+        if sesion is None:
+            return salida.fin(SALIDA_FALLO)
+        confianza = [sesion.certificado]
+
+    import hashlib
+    import firmador
+    from manifiesto import leer_manifiesto
+
+    # pyHanko avisa con una traza completa de cada certificado que no es de confianza
+    logging.getLogger("pyhanko").setLevel(logging.CRITICAL)
+    logging.getLogger("pyhanko_certvalidator").setLevel(logging.CRITICAL)
+
+    correctos = 0
+    fallidos = 0
+    manifiestos = {}  # carpeta -> {archivo: entrada}
+    for ruta in pdfs:
+        problemas = []
+        firmas = []
+        try:
+            carpeta = os.path.dirname(os.path.abspath(ruta))
+            if carpeta not in manifiestos:
+                manifiestos[carpeta] = leer_manifiesto(carpeta)
+            entrada = manifiestos[carpeta].get(os.path.basename(ruta))
+            if entrada:
+                with open(ruta, "rb") as f:
+                    if hashlib.sha256(f.read()).hexdigest() != entrada.get("sha256"):
+                        problemas.append("no coincide con el manifiesto")
+
+            firmas = firmador.verificar_pdf(ruta, confianza)
+            if not firmas:
+                problemas.append("sin firma")
+            for firma in firmas:
+                if not firma["integra"]:
+                    problemas.append("firma no válida (el PDF se ha modificado)")
+                elif confianza and not firma["de_confianza"]:
+                    problemas.append(f"firmado por otro certificado ({firma['firmante']})")
+            if firmas and firmas[-1]["integra"] and not firmas[-1]["completa"]:
+                problemas.append("hay cambios posteriores a la última firma")
+        except Exception as e:
+            problemas.append(str(e))
+
+        if problemas:
+            fallidos += 1
+            salida.log(f"❌ {ruta}: {'; '.join(problemas)}")
+        else:
+            correctos += 1
+            salida.log(f"✅ {ruta} (firmado por {firmas[-1]['firmante']})")
+        salida.evento("archivo", archivo=ruta, correcto=not problemas, problemas=problemas, firmas=firmas)
+
+    salida.log(f"FIN. Correctos: {correctos} | Con problemas: {fallidos}")
+    return salida.fin(SALIDA_ERRORES if fallidos else SALIDA_OK, correctos=correctos, fallidos=fallidos)
+
+# --- ARGUMENTOS ---
+
+def crear_parser():
+    comunes = argparse.ArgumentParser(add_help=False)
+    comunes.add_argument("--json", action="store_true", help="Progreso como una línea JSON por evento")
+
+    medicion = argparse.ArgumentParser(add_help=False)
+    medicion.add_argument("--tiempos", action="store_true", help="Tabla de tiempos por etapa al final")
+    medicion.add_argument("--metricas", metavar="RUTA", help="Añade los tiempos a este fichero (JSON Lines)")
+
+    certificado = argparse.ArgumentParser(add_help=False)
+    certificado.add_argument("--password", help=f"Contraseña (mejor con la variable {ENV_PASSWORD_PFX})")
+
+    parser = argparse.ArgumentParser(prog="python -m diplomas",
+                                     description="Generador de diplomas sin interfaz gráfica.")
+    sub = parser.add_subparsers(dest="comando", required=True, metavar="{generate,sign,send,verify}")
+
+    p = sub.add_parser("generate", aliases=["generar"], parents=[comunes, medicion, certificado],
+                       help="Genera los diplomas de un Excel")
+    p.add_argument("excel")
+    p.add_argument("--salida", metavar="CARPETA", help="Por defecto Diplomas_Generados junto al Excel")
+    p.add_argument("--sin-horas", action="store_true", help="No incluir la duración")
+    p.add_argument("--calificacion", action="store_true", help="Incluir la calificación")
+    p.add_argument("--extra", action="store_true", help="Incluir el campo extra")
+    p.add_argument("--pfx", help="Firmar cada diploma con este certificado")
+    p.add_argument("--firmante", help="Nombre del firmante (por defecto, el del certificado)")
+    p.add_argument("--procesos", type=int, default=None,
+                   help="Procesos generando en paralelo (por defecto, uno por núcleo; 1 con --procesos-firma)")
+    p.add_argument("--procesos-firma", type=int, default=0, help="Firmar en un pool aparte (incompatible con --procesos > 1)")
+    p.add_argument("--combinado", action="store_true", help="Un único PDF con todos los diplomas")
+    p.add_argument("--incremental", action="store_true", help="Solo las filas que han cambiado")
+    p.set_defaults(funcion=cmd_generar)
+
+    p = sub.add_parser("sign", aliases=["firmar"], parents=[comunes, certificado],
+                       help="Firma PDFs ya generados")
+    p.add_argument("rutas", nargs="+", metavar="PDF_O_CARPETA")
+    p.add_argument("--pfx", required=True)
+    p.add_argument("--refirmar", action="store_true", help="Firmar también los que ya tienen firma")
+    p.set_defaults(funcion=cmd_firmar)
+
+    p = sub.add_parser("send", aliases=["enviar"], parents=[comunes, medicion],
+                       help="Envía a cada alumno su diploma")
+    p.add_argument("excel")
+    p.add_argument("carpeta_pdfs")
+    p.add_argument("--proveedor", choices=["gmail", "office365", "hotmail", "manual", "outlook"], default="gmail")
+    p.add_argument("--usuario")
+    p.add_argument("--password", help=f"Contraseña SMTP (mejor con la variable {ENV_PASSWORD_SMTP})")
+    p.add_argument("--servidor", help="Con --proveedor manual")
+    p.add_argument("--puerto", type=int, default=587, help="Con --proveedor manual")
+    p.add_argument("--sin-tls", action="store_true", help="Con --proveedor manual")
+    p.add_argument("--conexiones", type=int, default=1)
+    p.add_argument("--ritmo", type=int, default=0, metavar="MENSAJES_POR_MINUTO", help="0 = sin límite")
+    p.add_argument("--asincrono", action="store_true", help="Motor asíncrono (aiosmtplib)")
+    p.add_argument("--reintentos", type=int, default=3, help="Con --asincrono")
+    p.add_argument("--reanudar", action="store_true", help="Saltar a quien ya lo recibió")
+    p.add_argument("--prueba", action="store_true", help="Outlook: abrir los borradores sin enviar")
+    p.set_defaults(funcion=cmd_enviar)
+
+    p = sub.add_parser("verify", aliases=["verificar"], parents=[comunes, certificado],
+                       help="Comprueba firmas y manifiesto de PDFs")
+    p.add_argument("rutas", nargs="+", metavar="PDF_O_CARPETA")
+    p.add_argument("--pfx", help="Exigir que estén firmados con este certificado")
+    p.set_defaults(funcion=cmd_verificar)
+
+    return parser
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+
+    if hasattr(sys.stdout, "reconfigure"):
+        sys.stdout.reconfigure(errors="backslashreplace")  # Consolas sin UTF-8 (emojis del log)
+    salida = Salida(args.json)
+    try:
+        if args.json:
+            # Con --json la salida estándar es solo para los eventos: los print() sueltos van a stderr
+            with redirect_stdout(sys.stderr):
+                return args.funcion(args, salida)
+        return args.funcion(args, salida)
+    except KeyboardInterrupt:
+        salida.log("⛔ Interrumpido.")
+        return salida.fin(SALIDA_INTERRUMPIDO)
+    except Exception as e:
+        salida.log(f"❌ Error inesperado: {e}")
+        return salida.fin(SALIDA_FALLO)
+
+if __name__ == "__main__":
+    sys.exit(main())
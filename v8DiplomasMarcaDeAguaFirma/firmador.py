@@ -1,12 +1,90 @@
 import os
-from pyhanko.sign import signers
-from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
-from pyhanko.sign.fields import SigSeedSubFilter
+import io
 
-def firmar_pdf(ruta_pdf_entrada, ruta_pfx, password_pfx, motivo="Certificación Académica", ubicacion="Burgos, España"):
+# pyHanko (y con él cryptography) se importa al abrir el primer certificado,
+# no al importar este módulo: la aplicación arranca sin pagar por ello.
+
+MOTIVO_DEFECTO = "Certificación Académica"
+UBICACION_DEFECTO = "Burgos, España"
+
+# Sesiones ya abiertas en este proceso: (ruta_pfx, password, mtime) -> SesionFirma
+_SESIONES = {}
+
+class SesionFirma:
+    """
+    Certificado .pfx/.p12 cargado una sola vez (lectura, derivación de la clave
+    con la contraseña y cadena de certificados) para firmar cualquier número de PDFs.
+    """
+    def __init__(self, ruta_pfx, password_pfx):
+        from pyhanko.sign import signers
+
+        if not os.path.exists(ruta_pfx):
+            raise FileNotFoundError(f"No existe el certificado {ruta_pfx}")
+
+        # Cargador oficial de pyHanko: maneja la decodificación del pfx de forma segura
+        self.signer = signers.SimpleSigner.load_pkcs12(
+            pfx_file=ruta_pfx,
+            passphrase=password_pfx.encode('utf-8') if password_pfx else None
+        )
+        if self.signer is None:
+            raise ValueError("No se pudo abrir el certificado (¿contraseña incorrecta?)")
+
+        self.ruta_pfx = ruta_pfx
+        self.certificado = self.signer.signing_cert
+
+        # 'Common Name' (Nombre y Apellidos) del propietario
+        self.nombre_firmante = self.certificado.subject.native.get("common_name") or "Firma Digital Verificada"
+
+    def _firmar_stream(self, inf, outf, motivo, ubicacion):
+        from pyhanko.sign import signers
+        from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+        from pyhanko.sign.fields import SigSeedSubFilter
+
+        # Metadatos de la firma (PAdES es el estándar europeo)
+        meta = signers.PdfSignatureMetadata(
+            field_name='FirmaDigitalUBU',
+            reason=motivo,
+            location=ubicacion,
+            subfilter=SigSeedSubFilter.PADES
+        )
+        w = IncrementalPdfFileWriter(inf)
+        signers.sign_pdf(
+            w, meta, signer=self.signer, output=outf,
+        )
+
+    def firmar(self, ruta_pdf_entrada, motivo=MOTIVO_DEFECTO, ubicacion=UBICACION_DEFECTO):
+        """Firma (PAdES) un PDF en disco, sobrescribiéndolo de forma segura"""
+        ruta_temp = ruta_pdf_entrada + ".signed.tmp"
+        with open(ruta_pdf_entrada, 'rb') as inf:
+            # Proceso de firma (sobre un temporal)
+            with open(ruta_temp, 'wb') as outf:
+                self._firmar_stream(inf, outf, motivo, ubicacion)
+
+        # Si todo fue bien, reemplazar el original
+        os.replace(ruta_temp, ruta_pdf_entrada)
+
+    def firmar_bytes(self, contenido_pdf, motivo=MOTIVO_DEFECTO, ubicacion=UBICACION_DEFECTO):
+        """Firma un PDF que está en memoria y devuelve los bytes firmados (sin tocar el disco)"""
+        salida = io.BytesIO()
+        self._firmar_stream(io.BytesIO(contenido_pdf), salida, motivo, ubicacion)
+        return salida.getvalue()
+
+def obtener_sesion(ruta_pfx, password_pfx):
+    """
+    Devuelve la SesionFirma de este certificado, cargándolo solo la primera vez
+    (en cada proceso). Si el .pfx cambia en disco se vuelve a cargar.
+    """
+    clave = (os.path.abspath(ruta_pfx), password_pfx, os.path.getmtime(ruta_pfx))
+    sesion = _SESIONES.get(clave)
+    if sesion is None:
+        sesion = SesionFirma(ruta_pfx, password_pfx)
+        _SESIONES[clave] = sesion
+    return sesion
+
+def firmar_pdf(ruta_pdf_entrada, ruta_pfx, password_pfx, motivo=MOTIVO_DEFECTO, ubicacion=UBICACION_DEFECTO):
     """
     Firma digitalmente un PDF usando un certificado .pfx/.p12.
-    Versión robustecida usando el cargador oficial de pyHanko.
+    El certificado se carga una vez y se reutiliza en las siguientes llamadas.
     """
     if not os.path.exists(ruta_pdf_entrada):
         print(f"❌ Error: No existe el PDF {ruta_pdf_entrada}")
@@ -17,35 +95,7 @@ def firmar_pdf(ruta_pdf_entrada, ruta_pfx, password_pfx, motivo="Certificación
         return False
 
     try:
-        # 1. Cargar el firmante usando el método de alto nivel de pyHanko
-        # Esto maneja la decodificación del pfx de forma más segura.
-        signer = signers.SimpleSigner.load_pkcs12(
-            pfx_file=ruta_pfx,
-            passphrase=password_pfx.encode('utf-8')
-        )
-
-        # 2. Preparar el archivo PDF
-        with open(ruta_pdf_entrada, 'rb') as inf:
-            w = IncrementalPdfFileWriter(inf)
-            
-            # 3. Metadatos de la firma (PAdES es el estándar europeo)
-            meta = signers.PdfSignatureMetadata(
-                field_name='FirmaDigitalUBU',
-                reason=motivo,
-                location=ubicacion,
-                subfilter=SigSeedSubFilter.PADES
-            )
-
-            # 4. Proceso de firma (sobrescribiendo el archivo de forma segura)
-            ruta_temp = ruta_pdf_entrada + ".signed.tmp"
-            
-            with open(ruta_temp, 'wb') as outf:
-                signers.sign_pdf(
-                    w, meta, signer=signer, output=outf,
-                )
-        
-        # 5. Si todo fue bien, reemplazar el original
-        os.replace(ruta_temp, ruta_pdf_entrada)
+        obtener_sesion(ruta_pfx, password_pfx).firmar(ruta_pdf_entrada, motivo, ubicacion)
         return True
 
     except Exception as e:
@@ -54,4 +104,52 @@ def firmar_pdf(ruta_pdf_entrada, ruta_pfx, password_pfx, motivo="Certificación
         # Limpiar archivo temporal si falló
         if os.path.exists(ruta_pdf_entrada + ".signed.tmp"):
             os.remove(ruta_pdf_entrada + ".signed.tmp")
-        return False
\ No newline at end of file
+        return False
+
+def firmar_bytes(contenido_pdf, ruta_pfx, password_pfx, motivo=MOTIVO_DEFECTO, ubicacion=UBICACION_DEFECTO):
+    """
+    Igual que firmar_pdf pero para un PDF en memoria: devuelve los bytes firmados
+    o None si la firma falla.
+    """
+    if not os.path.exists(ruta_pfx):
+        print(f"❌ Error: No existe el certificado {ruta_pfx}")
+        return None
+
+    try:
+        return obtener_sesion(ruta_pfx, password_pfx).firmar_bytes(contenido_pdf, motivo, ubicacion)
+
+    except Exception as e:
+        print(f"!!!!!!!!!! ERROR REAL DE FIRMA: {e} !!!!!!!!!!")
+        return None
+
+def verificar_pdf(ruta_pdf, certificados_confianza=None):
+    """
+    Comprueba las firmas de un PDF. Devuelve una lista (una entrada por firma) de dicts con:
+    firmante, integra (el contenido no ha cambiado y la firma es correcta),
+    completa (la firma cubre todo el archivo), de_confianza y fecha.
+    certificados_confianza: certificados raíz aceptados (p.ej. SesionFirma.certificado);
+    sin ellos, de_confianza solo será True si la cadena llega a una raíz del sistema.
+    """
+    from pyhanko.pdf_utils.reader import PdfFileReader
+    from pyhanko.sign.validation import validate_pdf_signature
+    from pyhanko.sign.validation.status import SignatureCoverageLevel
+    from pyhanko_certvalidator import ValidationContext
+
+    if certificados_confianza:
+        contexto = ValidationContext(trust_roots=list(certificados_confianza), allow_fetching=False)
+    else:
+        contexto = ValidationContext(allow_fetching=False)
+
+    resultado = []
+    with open(ruta_pdf, 'rb') as f:
+        for firma in PdfFileReader(f).embedded_signatures:
+            estado = validate_pdf_signature(firma, contexto)
+            fecha = estado.signer_reported_dt
+            resultado.append({
+                "firmante": estado.signing_cert.subject.native.get("common_name"),
+                "integra": bool(estado.intact and estado.valid),
+                "completa": estado.coverage == SignatureCoverageLevel.ENTIRE_FILE,
+                "de_confianza": bool(estado.trusted),
+                "fecha": fecha.isoformat() if fecha else None,
+            })
+    return resultado
@@ -1,19 +1,139 @@
 import os
+import io
+import csv
+import copy
+import json
+import signal
+import hashlib
+from functools import lru_cache
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from reportlab.lib.pagesizes import A4, landscape, portrait
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import mm
 from reportlab.lib.utils import ImageReader
 from reportlab.lib.colors import HexColor
-import pandas as pd
-from utils import texto_seguro, parse_calificacion, cargar_configuracion_plantilla, email_a_id, limpiar_nombre_curso
+from reportlab.pdfbase.pdfdoc import PDFImageXObject
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from utils import texto_seguro, parse_calificacion, cargar_configuracion_plantilla, cargar_plantilla, limpiar_cache_plantillas, FilasExcel, preparar_filas
 import firmador
+import metricas
+from progreso import Progreso
+from trabajo import ControlTrabajo
+from manifiesto import Manifiesto, crear_entrada
 
 # Valores por defecto por si el JSON está incompleto
 DEFAULT_FONT = "Helvetica"
 DEFAULT_COLOR = "#000000"
 
+# Auto-ajuste: nunca se baja de este tamaño de letra
+TAMANO_MINIMO = 6
+# Ancho máximo del nombre del firmante si la plantilla no dice otra cosa (aprox 9 cm)
+ANCHO_FIRMA_MM = 90
+
+# Fondos ya decodificados y comprimidos: ruta -> PDFImageXObject (prototipo)
+_CACHE_FONDOS = {}
+
+# Modos de salida de procesar_excel_y_generar
+MODO_INDIVIDUAL = "individual"  # Un PDF por alumno (para enviar por correo)
+MODO_COMBINADO = "combinado"    # Un único PDF con una página por alumno (para imprimir)
+NOMBRE_COMBINADO = "Diplomas_Combinados"
+
+# Modo incremental: si cambia cómo se dibuja un diploma, subir este número
+# para que la siguiente ejecución incremental lo regenere todo
+VERSION_DISENO = 1
+
+# Columnas del Excel que acaban dibujadas en el diploma (entran en la huella de cada fila)
+CAMPOS_RENDERIZADOS = ("nombre", "apellido1", "apellido2", "curso_nombre", "fecha", "id_plantilla")
+
+# Huella de cada plantilla (config.json + fondo) durante una ejecución
+_CACHE_HUELLAS_PLANTILLA = {}
+
+# Filas que recibe cada proceso de una vez en el modo paralelo (como mucho): en Excel
+# pequeños el lote se reduce para que haya unos LOTES_POR_PROCESO lotes por proceso
+TAMANO_LOTE = 50
+LOTES_POR_PROCESO = 4
+
+@lru_cache(maxsize=4096)
+def _ancho_unitario(texto, fuente):
+    """Ancho del texto con tamaño 1 (el ancho real es proporcional al tamaño)"""
+    return stringWidth(texto, fuente, 1)
+
+@lru_cache(maxsize=4096)
+def tamano_ajustado(texto, fuente, tamano, ancho_max, tamano_min=TAMANO_MINIMO):
+    """
+    Tamaño de letra con el que 'texto' cabe en 'ancho_max' puntos, sin pasar de 'tamano'
+    ni bajar de 'tamano_min'. Se calcula directamente (ancho = tamaño x ancho unitario)
+    y se memoriza: el nombre del firmante, p.ej., se mide una sola vez por ejecución.
+    """
+    ancho = _ancho_unitario(texto, fuente)
+    if not ancho_max or ancho * tamano <= ancho_max:
+        return tamano
+    return max(tamano_min, ancho_max / ancho)
+
+def _partir_lineas(palabras, anchos, ancho_espacio, capacidad):
+    """Reparto voraz de las palabras en líneas de como mucho 'capacidad' (en anchos unitarios)"""
+    lineas = []
+    actual, ancho_actual = [], 0
+    for palabra, ancho in zip(palabras, anchos):
+        if actual and ancho_actual + ancho_espacio + ancho > capacidad:
+            lineas.append(actual)
+            actual, ancho_actual = [], 0
+        ancho_actual += (ancho_espacio if actual else 0) + ancho
+        actual.append(palabra)
+    if actual:
+        lineas.append(actual)
+    return lineas
+
+@lru_cache(maxsize=4096)
+def ajustar_texto(texto, fuente, tamano, ancho_max, max_lineas=1, tamano_min=TAMANO_MINIMO):
+    """
+    Reparte 'texto' en como mucho 'max_lineas' líneas de 'ancho_max' puntos y devuelve
+    (tamaño, líneas). Solo reduce el tamaño (hasta 'tamano_min') si partiendo en líneas
+    no basta. Como el ancho es proporcional al tamaño, todo se mide una vez con tamaño 1.
+    Si ni con el tamaño mínimo cabe, lo que sobra se añade a la última línea.
+    """
+    palabras = texto.split()
+    if max_lineas <= 1 or len(palabras) <= 1:
+        return tamano_ajustado(texto, fuente, tamano, ancho_max, tamano_min), (texto,)
+
+    anchos = [_ancho_unitario(p, fuente) for p in palabras]
+    ancho_espacio = _ancho_unitario(" ", fuente)
+
+    def cabe(capacidad):
+        # Una palabra más ancha que la línea no se puede partir: no cabe
+        return max(anchos) <= capacidad and len(_partir_lineas(palabras, anchos, ancho_espacio, capacidad)) <= max_lineas
+
+    # 1. Capacidad (en anchos unitarios) que da el tamaño pedido
+    capacidad = ancho_max / tamano
+    if not cabe(capacidad):
+        # 2. Menor capacidad con la que entra en max_lineas (búsqueda binaria): el tamaño es ancho_max / capacidad
+        bajo = capacidad
+        alto = sum(anchos) + ancho_espacio * (len(palabras) - 1)
+        while alto - bajo > alto * 1e-3:
+            medio = (bajo + alto) / 2
+            if cabe(medio):
+                alto = medio
+            else:
+                bajo = medio
+        capacidad = min(alto, ancho_max / tamano_min)
+        tamano = ancho_max / capacidad
+
+    lineas = _partir_lineas(palabras, anchos, ancho_espacio, capacidad)
+    if len(lineas) > max_lineas:
+        lineas[max_lineas - 1:] = [sum(lineas[max_lineas - 1:], [])]
+    return tamano, tuple(" ".join(linea) for linea in lineas)
+
 def dibujar_texto_config(c, config_elem, texto, width):
-    """Dibuja un elemento de texto basado en su configuración JSON"""
+    """
+    Dibuja un elemento de texto basado en su configuración JSON.
+    Claves opcionales para textos largos:
+      "ancho_max_mm": ancho disponible; si no cabe se parte en líneas y/o se reduce el tamaño.
+      "max_lineas":   líneas en las que se puede partir (1 por defecto).
+      "tamano_min":   tamaño mínimo al reducir (6 por defecto).
+      "interlineado": distancia entre líneas en mm (por defecto 1,2 veces el tamaño).
+    El bloque de líneas queda centrado verticalmente en "y_mm".
+    """
     if not config_elem or not texto:
         return
 
@@ -33,74 +153,112 @@ def dibujar_texto_config(c, config_elem, texto, width):
         c.setFont("Helvetica", tamano) # Fallback si la fuente no existe
         c.setFillColor(HexColor("#000000"))
 
+    # Auto-ajuste al ancho disponible (con la fuente que realmente se usa)
+    lineas = (str(texto),)
+    tamano_final = tamano
+    ancho_max = config_elem.get("ancho_max_mm")
+    if ancho_max:
+        tamano_final, lineas = ajustar_texto(
+            lineas[0], c._fontname, tamano, ancho_max * mm,
+            config_elem.get("max_lineas", 1), config_elem.get("tamano_min", TAMANO_MINIMO)
+        )
+        if tamano_final != tamano:
+            c.setFont(c._fontname, tamano_final)
+
+    # Separación entre líneas (si se ha reducido la letra, se reduce igual)
+    interlineado = config_elem.get("interlineado")
+    salto = interlineado * mm * tamano_final / tamano if interlineado else tamano_final * 1.2
+    y += (len(lineas) - 1) * salto / 2
+
     # Dibujar según alineación
-    if align == "center":
-        # Si x es 0 en el JSON, asumimos centro de página
-        pos_x = x if x > 0 else (width / 2)
-        c.drawCentredString(pos_x, y, str(texto))
-    elif align == "right":
-        c.drawRightString(x, y, str(texto))
-    else: # Left
-        c.drawString(x, y, str(texto))
+    for linea in lineas:
+        if align == "center":
+            # Si x es 0 en el JSON, asumimos centro de página
+            pos_x = x if x > 0 else (width / 2)
+            c.drawCentredString(pos_x, y, linea)
+        elif align == "right":
+            c.drawRightString(x, y, linea)
+        else: # Left
+            c.drawString(x, y, linea)
+        y -= salto
 
-def crear_pdf_individual(row, opciones, ruta_salida, logo_global_path, nombre_firmante_personalizado=None):
-    mostrar_horas, mostrar_calif, mostrar_extra = opciones
-    
-    # 1. IDENTIFICAR QUÉ PLANTILLA USAR
-    # Buscamos la columna 'id_plantilla' en el excel. Si no existe, None.
-    id_plantilla = row.get("id_plantilla")
-    
-    # 2. CARGAR CONFIGURACIÓN
-    config, ruta_fondo = cargar_configuracion_plantilla(id_plantilla)
-    
-    # 3. PREPARAR PÁGINA
-    orientacion = config.get("orientacion", "landscape").lower()
-    if orientacion == "portrait":
-        pagesize = portrait(A4)
-        width, height = portrait(A4)
-    else:
-        pagesize = landscape(A4)
-        width, height = landscape(A4)
-        
-    c = canvas.Canvas(ruta_salida, pagesize=pagesize)
+def obtener_fondo(ruta_fondo):
+    """
+    Devuelve la imagen de fondo ya decodificada y comprimida como XObject de PDF.
+    El PNG se lee una sola vez por ejecución; después solo se reutilizan sus bytes.
+    """
+    fondo = _CACHE_FONDOS.get(ruta_fondo)
+    if fondo is None:
+        nombre = "fondo_" + hashlib.md5(os.path.abspath(ruta_fondo).encode("utf-8")).hexdigest()
+        fondo = PDFImageXObject(nombre, ruta_fondo)
+        _CACHE_FONDOS[ruta_fondo] = fondo
+    return fondo
+
+def limpiar_cache_fondos():
+    """Olvida los fondos precargados (se llama al empezar cada ejecución)"""
+    _CACHE_FONDOS.clear()
+
+def dibujar_fondo(c, ruta_fondo, width, height):
+    """
+    Equivalente a c.drawImage(ruta_fondo, 0, 0, width, height) pero sin volver
+    a decodificar ni comprimir el PNG: se registra en el documento una copia
+    ligera del XObject precargado (comparte los bytes del stream).
+    """
+    fondo = obtener_fondo(ruta_fondo)
+    nombre_reg = c._doc.getXObjectName(fondo.name)
+    if nombre_reg not in c._doc.idToObject:
+        # Cada documento necesita su propio objeto (ReportLab le asigna un nombre interno al registrarlo)
+        imagen = copy.copy(fondo)
+        c._doc.Reference(imagen, nombre_reg)
+        c._doc.addForm(fondo.name, imagen)
+
+    c._currentPageHasImages = 1
+    c.saveState()
+    c.scale(width, height)
+    c._code.append("/%s Do" % nombre_reg)
+    c.restoreState()
+    c._formsinuse.append(fondo.name)
 
-    # 4. DIBUJAR FONDO
+def _dibujar_contenido_estatico(c, config, ruta_fondo, width, height, nombre_firmante_personalizado):
+    """Fondo (o marco de seguridad) y bloque de firma: lo común a todos los diplomas de la plantilla"""
+    # DIBUJAR FONDO
     if ruta_fondo:
         try:
-            c.drawImage(ruta_fondo, 0, 0, width=width, height=height)
+            dibujar_fondo(c, ruta_fondo, width, height)
         except Exception:
-            pass # Si falla, sale blanco
+            ruta_fondo = None # Si falla, sale blanco
     else:
         # Si no hay imagen, un marco básico de seguridad
         c.setLineWidth(1)
         c.rect(10*mm, 10*mm, width-20*mm, height-20*mm)
 
-    # 5. DIBUJAR ELEMENTOS DEFINIDOS EN JSON
-    elems = config.get("elementos", {})
-    
-    # -- Datos básicos --
-    
-    # Nombre Alumno
-    nombre_completo = " ".join([
-        texto_seguro(row.get("nombre")),
-        texto_seguro(row.get("apellido1")),
-        texto_seguro(row.get("apellido2"))
-    ]).strip().upper()
-    dibujar_texto_config(c, elems.get("nombre_alumno"), nombre_completo, width)
-
-    # Nombre Curso
-    curso = texto_seguro(row.get("curso_nombre"))
-    dibujar_texto_config(c, elems.get("nombre_curso"), curso, width)
-
-    # Fecha
-    fecha = texto_seguro(row.get("fecha"))
-    if fecha:
-        txt_fecha = f"Fecha: {fecha}" # Puedes ajustar el prefijo aquí o en el Excel
-        dibujar_texto_config(c, elems.get("fecha"), txt_fecha, width)
-        
-    # 5. FIRMA / RESPONSABLE
-    elem_firma = elems.get("firma", {})
-    
+    # FIRMA / RESPONSABLE
+    dibujar_firma(c, config.get("elementos", {}).get("firma", {}), nombre_firmante_personalizado)
+    return ruta_fondo
+
+def dibujar_capa_estatica(c, config, ruta_fondo, width, height, nombre_firmante_personalizado=None, compartida=True):
+    """
+    Dibuja la capa estática de la plantilla en la página actual. Con compartida=True
+    (documentos de varias páginas, como el PDF combinado) la capa se guarda una sola
+    vez por documento como form XObject y cada página la referencia con un 'Do';
+    en los PDFs de una página se dibuja directamente (un form solo añadiría bytes).
+    """
+    if not compartida:
+        _dibujar_contenido_estatico(c, config, ruta_fondo, width, height, nombre_firmante_personalizado)
+        return
+
+    clave = (ruta_fondo, width, height,
+             json.dumps(config.get("elementos", {}).get("firma", {}), sort_keys=True),
+             nombre_firmante_personalizado)
+    nombre = "capa_" + hashlib.md5(repr(clave).encode("utf-8")).hexdigest()
+    if not c.hasForm(nombre):
+        c.beginForm(nombre, 0, 0, width, height)
+        _dibujar_contenido_estatico(c, config, ruta_fondo, width, height, nombre_firmante_personalizado)
+        c.endForm()
+    c.doForm(nombre)
+
+def dibujar_firma(c, elem_firma, nombre_firmante_personalizado=None):
+    """Bloque de firma: nombre del firmante (o 'Firma Responsable') y el subtítulo de firma digital"""
     # Coordenadas base
     x = elem_firma.get("x_mm", 200) * mm
     y = elem_firma.get("y_mm", 35) * mm
@@ -115,24 +273,12 @@ def crear_pdf_individual(row, opciones, ruta_salida, logo_global_path, nombre_fi
         es_digital = True
 
     # --- LÓGICA ANTI-DESBORDAMIENTO (AUTO-AJUSTE) ---
-    from reportlab.pdfbase.pdfmetrics import stringWidth
-    
-    # 1. Definimos el ancho máximo permitido para la firma (aprox 9 cm)
-    max_ancho_permitido = 90 * mm 
-    
-    # 2. Empezamos con el tamaño de fuente deseado
-    tamano_actual = tamano_base
+    # Ancho máximo permitido para la firma (la plantilla puede cambiarlo con "ancho_max_mm")
+    max_ancho_permitido = elem_firma.get("ancho_max_mm", ANCHO_FIRMA_MM) * mm
     font_name = "Helvetica-Bold"
-    
-    # 3. Calculamos cuánto ocupa el texto
-    ancho_texto = stringWidth(texto_a_pintar, font_name, tamano_actual)
-    
-    # 4. Si se pasa, reducimos el tamaño en un bucle hasta que quepa
-    while ancho_texto > max_ancho_permitido and tamano_actual > 6:
-        tamano_actual -= 0.5
-        ancho_texto = stringWidth(texto_a_pintar, font_name, tamano_actual)
-        
-    # --- FIN LÓGICA AUTO-AJUSTE ---
+
+    # Si se pasa, el tamaño justo para que quepa (calculado una vez por firmante)
+    tamano_actual = tamano_ajustado(texto_a_pintar, font_name, tamano_base, max_ancho_permitido)
 
     # Configuramos fuente con el tamaño calculado (puede ser menor que el base)
     c.setFont(font_name, tamano_actual)
@@ -160,8 +306,69 @@ def crear_pdf_individual(row, opciones, ruta_salida, logo_global_path, nombre_fi
             c.setFillColor(HexColor("#555555"))
             c.drawString(x, y - (4*mm), "(Firmado Digitalmente)")
 
+def crear_pdf_individual(row, opciones, ruta_salida, logo_global_path, nombre_firmante_personalizado=None, nombre_completo=None):
+    c = canvas.Canvas(ruta_salida)
+    dibujar_diploma(c, row, opciones, logo_global_path, nombre_firmante_personalizado, nombre_completo, capa_compartida=False)
+    with metricas.medir("guardar_pdf"):
+        c.save()
+
+def dibujar_diploma(c, row, opciones, logo_global_path, nombre_firmante_personalizado=None, nombre_completo=None, capa_compartida=True):
+    """
+    Dibuja el diploma de una fila como una página nueva del canvas 'c'.
+    nombre_completo puede venir ya calculado (preparar_filas); si no, se compone aquí.
+    capa_compartida=False para documentos de una sola página (ver dibujar_capa_estatica).
+    """
+    mostrar_horas, mostrar_calif, mostrar_extra = opciones
+    
+    # 1. IDENTIFICAR QUÉ PLANTILLA USAR
+    # Buscamos la columna 'id_plantilla' en el excel. Si no existe, None.
+    id_plantilla = row.get("id_plantilla")
+    
+    # 2. CARGAR CONFIGURACIÓN
+    with metricas.medir("plantilla"):
+        config, ruta_fondo = cargar_configuracion_plantilla(id_plantilla)
+    
+    # 3. PREPARAR PÁGINA
+    orientacion = config.get("orientacion", "landscape").lower()
+    if orientacion == "portrait":
+        pagesize = portrait(A4)
+        width, height = portrait(A4)
+    else:
+        pagesize = landscape(A4)
+        width, height = landscape(A4)
+        
+    c.setPageSize(pagesize)
+
+    # 4. CAPA ESTÁTICA: fondo (o marco), firma y "(Firmado Digitalmente)"
+    with metricas.medir("capa_estatica"):
+        dibujar_capa_estatica(c, config, ruta_fondo, width, height, nombre_firmante_personalizado, capa_compartida)
+
+    # 5. DIBUJAR ELEMENTOS DEFINIDOS EN JSON
+    elems = config.get("elementos", {})
+    
+    with metricas.medir("textos"):
+        # -- Datos básicos --
+
+        # Nombre Alumno
+        if nombre_completo is None:
+            nombre_completo = " ".join([
+                texto_seguro(row.get("nombre")),
+                texto_seguro(row.get("apellido1")),
+                texto_seguro(row.get("apellido2"))
+            ]).strip().upper()
+        dibujar_texto_config(c, elems.get("nombre_alumno"), nombre_completo, width)
+
+        # Nombre Curso
+        curso = texto_seguro(row.get("curso_nombre"))
+        dibujar_texto_config(c, elems.get("nombre_curso"), curso, width)
+
+        # Fecha
+        fecha = texto_seguro(row.get("fecha"))
+        if fecha:
+            txt_fecha = f"Fecha: {fecha}" # Puedes ajustar el prefijo aquí o en el Excel
+            dibujar_texto_config(c, elems.get("fecha"), txt_fecha, width)
+        
     c.showPage()
-    c.save()
 
 # --- Funciones de control (igual que antes) ---
 
@@ -169,12 +376,9 @@ def generar_preview(excel_path, opciones, logo_path, callback_log):
     # (Igual que antes pero usa crear_pdf_individual actualizado)
     from utils import texto_seguro, abrir_archivo 
     try:
-        df = pd.read_excel(excel_path)
-        df.columns = [c.lower().strip() for c in df.columns]
-        if df.empty: return
-
+        # Basta con leer hasta la primera fila válida
         row_demo = None
-        for i, row in df.iterrows():
+        for i, row in FilasExcel(excel_path):
             if texto_seguro(row.get("email")) and texto_seguro(row.get("nombre")):
                 row_demo = row
                 break
@@ -190,59 +394,452 @@ def generar_preview(excel_path, opciones, logo_path, callback_log):
     except Exception as e:
         callback_log(f"❌ Error preview: {e}")
 
-def procesar_excel_y_generar(excel_path, output_folder, opciones, logo_path, callback_log, datos_firma=None, nombre_firmante=None):
+def _renderizar_fila(fila, opciones, logo_path, nombre_firmante=None):
+    """Renderiza en memoria el diploma de una FilaPreparada y devuelve los bytes del PDF"""
+    buffer = io.BytesIO()
+    crear_pdf_individual(fila.datos, opciones, buffer, logo_path, nombre_firmante, fila.nombre_completo)
+    return buffer.getvalue()
+
+def _firmar_y_guardar(fila, contenido, output_folder, datos_firma=None):
+    """
+    Firma el PDF (si toca) directamente desde memoria y lo escribe en disco
+    una única vez (importante en unidades de red).
+    Devuelve (sufijo para el log, entrada del manifiesto).
+    """
+    msg_extra = ""
+    firmado = False
+    if datos_firma:
+        ruta_pfx, pass_pfx = datos_firma
+        with metricas.medir("firma"):
+            contenido_firmado = firmador.firmar_bytes(contenido, ruta_pfx, pass_pfx)
+        if contenido_firmado:
+            contenido = contenido_firmado
+            firmado = True
+            msg_extra = " [🔏 FIRMADO]"
+        else:
+            msg_extra = " [❌ ERROR FIRMA]"
+            # Opcional: Contar como error o dejarlo pasar sin firmar
+
+    with metricas.medir("escritura"):
+        with open(os.path.join(output_folder, fila.archivo), "wb") as f:
+            f.write(contenido)
+    metricas.contar("bytes_pdf", len(contenido))
+
+    plantilla = texto_seguro(fila.datos.get("id_plantilla")) or "default"
+    return msg_extra, crear_entrada(fila, plantilla, contenido, firmado)
+
+def _generar_fila(fila, output_folder, opciones, logo_path, datos_firma=None, nombre_firmante=None):
+    """
+    Genera (y firma si toca) el diploma de una FilaPreparada.
+    Devuelve (generado, mensaje, entrada del manifiesto). El mensaje es None si
+    no hay nada que registrar y la entrada es None si no se escribió ningún PDF.
+    """
+    try:
+        if not fila.valida:
+            return False, None, None
+
+        # Nombre compuesto único: <email_id>__<curso_id>.pdf (ya calculado en preparar_filas)
+        contenido = _renderizar_fila(fila, opciones, logo_path, nombre_firmante)
+        msg_extra, entrada = _firmar_y_guardar(fila, contenido, output_folder, datos_firma)
+        
+        # Añadimos feedback visual al log
+        return True, f"Generado: {fila.archivo}{msg_extra}", entrada
+
+    except Exception as e:
+        return False, f"[ERROR] Fila {fila.i+2}: {e}", None
+
+# En cada proceso del pool: eventos del trabajo (marcado al cancelar / sin marcar en pausa)
+_CANCELADO = None
+_EN_MARCHA = None
+
+def _ignorar_ctrl_c():
+    # Ctrl+C llega a todos los procesos de la consola: lo atiende solo el principal
+    # (cancela el trabajo y recoge lo hecho) para que no muera un proceso a media tarea
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _iniciar_proceso_generador(cancelado, en_marcha):
+    """Inicializador de los procesos del pool de generación"""
+    global _CANCELADO, _EN_MARCHA
+    _CANCELADO = cancelado
+    _EN_MARCHA = en_marcha
+    _ignorar_ctrl_c()
+
+def _seguir_en_proceso():
+    """Punto de control dentro de un proceso del pool: espera si está en pausa. False si hay que parar"""
+    if _EN_MARCHA is not None:
+        _EN_MARCHA.wait()
+    return _CANCELADO is None or not _CANCELADO.is_set()
+
+def _generar_lote(lote, output_folder, opciones, logo_path, datos_firma=None, nombre_firmante=None):
+    """
+    Trabajo de un proceso del pool: genera un bloque de filas consecutivas.
+    Entre fila y fila respeta la pausa; si el trabajo se cancela a mitad, devuelve
+    solo los resultados de las filas hechas.
+    """
+    resultados = []
+    for fila in lote:
+        if not _seguir_en_proceso():
+            break
+        resultados.append(_generar_fila(fila, output_folder, opciones, logo_path, datos_firma, nombre_firmante))
+    return resultados
+
+def _recoger_si_sigue(futuro, control):
+    """
+    metricas.recoger(futuro), salvo que el trabajo se haya cancelado y la tarea aún
+    no hubiera empezado: entonces se anula y devuelve None.
+    """
+    if control.cancelado and futuro.cancel():
+        return None
+    return metricas.recoger(futuro)
+
+def _tamano_lote(total_filas, num_procesos):
+    """Filas por lote para repartir 'total_filas' entre todos los procesos (entre 1 y TAMANO_LOTE)"""
+    if not total_filas:
+        return TAMANO_LOTE
+    return max(1, min(TAMANO_LOTE, -(-total_filas // (num_procesos * LOTES_POR_PROCESO))))
+
+def _generar_en_paralelo(filas, num_procesos, tamano_lote, control, *args):
+    """
+    Reparte las filas en lotes entre varios procesos y devuelve los resultados
+    en el mismo orden del Excel. Solo se mantienen en vuelo unos pocos lotes
+    por proceso para no cargar todo el Excel en la cola del pool.
+    En pausa, los lotes en marcha esperan tras la fila en curso. Al cancelar, los lotes
+    sin empezar se anulan y los que están en marcha se cortan tras la fila en curso;
+    lo ya generado se devuelve (y queda en el manifiesto).
+    """
+    def lotes():
+        lote = []
+        for fila in filas:
+            lote.append(fila)
+            if len(lote) >= tamano_lote:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+
+    with ProcessPoolExecutor(max_workers=num_procesos, initializer=_iniciar_proceso_generador,
+                             initargs=control.eventos_procesos()) as pool:
+        en_vuelo = deque()
+        for lote in lotes():
+            en_vuelo.append(metricas.lanzar(pool, _generar_lote, lote, *args))
+            if len(en_vuelo) >= num_procesos * 2:
+                yield from _recoger_si_sigue(en_vuelo.popleft(), control) or ()
+        while en_vuelo:
+            yield from _recoger_si_sigue(en_vuelo.popleft(), control) or ()
+
+def _iniciar_proceso_firma(cancelado, en_marcha, ruta_pfx, pass_pfx):
+    """Inicializador de cada proceso firmante: carga el certificado una sola vez"""
+    _iniciar_proceso_generador(cancelado, en_marcha)
+    try:
+        firmador.obtener_sesion(ruta_pfx, pass_pfx)
+    except Exception as e:
+        # firmar_bytes volverá a intentarlo y marcará las filas con error de firma
+        print(f"Error cargando el certificado en el proceso de firma: {e}")
+
+def _firmar_y_guardar_si_sigue(*args):
+    """_firmar_y_guardar en un proceso del pool, respetando la pausa; None si se ha cancelado"""
+    if not _seguir_en_proceso():
+        return None
+    return _firmar_y_guardar(*args)
+
+def _generar_con_firma_en_paralelo(filas, procesos_firma, control, output_folder, opciones, logo_path, datos_firma, nombre_firmante=None):
+    """
+    Productor/consumidor: este hilo renderiza los PDFs en memoria mientras un pool
+    de procesos los firma (cada proceso carga el certificado una vez) y los escribe.
+    El tiempo total tiende a max(renderizar, firmar) en lugar de su suma.
+    Los resultados salen en el orden del Excel. En pausa, los firmantes esperan
+    antes de la siguiente firma; al cancelar, las firmas que aún no habían empezado
+    se anulan (esas filas no se cuentan ni se registran).
+    """
+    def resultado(fila, futuro, error):
+        if error or futuro is None:
+            return False, error, None
+        try:
+            recogido = _recoger_si_sigue(futuro, control)
+            if recogido is None:
+                return None
+            msg_extra, entrada = recogido
+            return True, f"Generado: {fila.archivo}{msg_extra}", entrada
+        except Exception as e:
+            return False, f"[ERROR] Fila {fila.i+2}: {e}", None
+
+    with ProcessPoolExecutor(max_workers=procesos_firma, initializer=_iniciar_proceso_firma,
+                             initargs=(*control.eventos_procesos(), *datos_firma)) as pool:
+        en_vuelo = deque()
+        for fila in filas:
+            if not fila.valida:
+                en_vuelo.append((fila, None, None))
+            else:
+                try:
+                    contenido = _renderizar_fila(fila, opciones, logo_path, nombre_firmante)
+                    en_vuelo.append((fila, metricas.lanzar(pool, _firmar_y_guardar_si_sigue, fila, contenido, output_folder, datos_firma), None))
+                except Exception as e:
+                    en_vuelo.append((fila, None, f"[ERROR] Fila {fila.i+2}: {e}"))
+
+            # Cola acotada: si los firmantes van por detrás, el renderizado espera
+            while len(en_vuelo) > procesos_firma * 4:
+                r = resultado(*en_vuelo.popleft())
+                if r is not None:
+                    yield r
+        while en_vuelo:
+            r = resultado(*en_vuelo.popleft())
+            if r is not None:
+                yield r
+
+def _generar_combinado(filas, output_folder, opciones, logo_path, callback_log, datos_firma=None, nombre_firmante=None, progreso=None, control=None):
+    """
+    Escribe todos los diplomas como páginas de un único PDF (el fondo se guarda
+    una sola vez y todas las páginas lo referencian) junto a un índice CSV
+    página -> alumno. Devuelve (generados, errores).
+    Si se cancela no se escribe nada: el PDF y el índice anteriores siguen como estaban.
+    """
+    ruta_pdf = os.path.join(output_folder, NOMBRE_COMBINADO + ".pdf")
+    ruta_indice = os.path.join(output_folder, NOMBRE_COMBINADO + "_indice.csv")
+
+    generados = 0
+    errores = 0
+    progreso = progreso or Progreso()
+    control = control or ControlTrabajo()
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer)
+    # utf-8-sig y ';' para que Excel en español lo abra directamente.
+    # Se escribe en un temporal y se publica junto con el PDF
+    with open(ruta_indice + ".tmp", "w", newline="", encoding="utf-8-sig") as f_indice:
+        indice = csv.writer(f_indice, delimiter=";")
+        indice.writerow(["pagina", "fila", "email", "alumno", "curso", "plantilla"])
+
+        for fila in filas:
+            try:
+                if not fila.valida:
+                    errores += 1
+                    progreso.avanzar(errores=1)
+                    continue
+
+                dibujar_diploma(c, fila.datos, opciones, logo_path, nombre_firmante, fila.nombre_completo)
+                generados += 1
+
+                plantilla = texto_seguro(fila.datos.get("id_plantilla")) or "default"
+                indice.writerow([generados, fila.i + 2, fila.email, fila.nombre_completo, fila.curso, plantilla])
+                callback_log(f"Página {generados}: {fila.email} ({fila.curso})")
+                progreso.avanzar()
+
+            except Exception as e:
+                callback_log(f"[ERROR] Fila {fila.i+2}: {e}")
+                errores += 1
+                progreso.avanzar(errores=1)
+
+    if control.cancelado:
+        os.remove(ruta_indice + ".tmp")
+        callback_log("⛔ PDF combinado no escrito (trabajo cancelado).")
+        return generados, errores
+
+    with metricas.medir("guardar_pdf"):
+        c.save()
+    contenido = buffer.getvalue()
+
+    # Un único documento -> una única firma (desde memoria)
+    if datos_firma and generados:
+        ruta_pfx, pass_pfx = datos_firma
+        with metricas.medir("firma"):
+            firmado = firmador.firmar_bytes(contenido, ruta_pfx, pass_pfx)
+        if firmado:
+            contenido = firmado
+            callback_log("🔏 PDF combinado firmado.")
+        else:
+            callback_log("❌ Error al firmar el PDF combinado.")
+
+    with metricas.medir("escritura"):
+        with open(ruta_pdf, "wb") as f:
+            f.write(contenido)
+    os.replace(ruta_indice + ".tmp", ruta_indice)
+    metricas.contar("bytes_pdf", len(contenido))
+    callback_log(f"📄 PDF combinado: {os.path.basename(ruta_pdf)} | Índice: {os.path.basename(ruta_indice)}")
+
+    return generados, errores
+
+def _huella_plantilla(id_plantilla):
+    """Hash del config.json (ya parseado) y de la imagen de fondo de una plantilla"""
+    carpeta, marca, config, ruta_fondo = cargar_plantilla(id_plantilla)
+    # Clave: carpeta + fechas de la carpeta y del config.json + fecha del fondo
+    # (varias plantillas sin fondo no comparten huella)
+    try:
+        marca_fondo = os.stat(ruta_fondo).st_mtime_ns if ruta_fondo else None
+    except OSError:
+        marca_fondo = None
+    clave = (carpeta, marca, marca_fondo)
+    huella = _CACHE_HUELLAS_PLANTILLA.get(clave)
+    if huella is None:
+        h = hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8"))
+        if ruta_fondo:
+            with open(ruta_fondo, "rb") as f:
+                h.update(f.read())
+        huella = h.hexdigest()
+        _CACHE_HUELLAS_PLANTILLA[clave] = huella
+    return huella
+
+def _huella_comun(opciones, datos_firma, nombre_firmante):
+    """Parte de la huella que es igual para todas las filas: opciones, firmante y diseño"""
+    certificado = ""
+    if datos_firma:
+        try:
+            certificado = firmador.obtener_sesion(*datos_firma).certificado.sha256.hex()
+        except Exception:
+            certificado = "sin_certificado"
+    return [VERSION_DISENO, list(opciones), nombre_firmante or "", certificado]
+
+def _huella_fila(fila, comun):
+    """Huella de todo lo que influye en el PDF de una fila"""
+    campos = [texto_seguro(fila.datos.get(c)) for c in CAMPOS_RENDERIZADOS]
+    datos = [comun, _huella_plantilla(fila.datos.get("id_plantilla")), campos]
+    return hashlib.sha256(json.dumps(datos, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def procesar_excel_y_generar(excel_path, output_folder, opciones, logo_path, callback_log, datos_firma=None, nombre_firmante=None, num_procesos=1, modo_salida=MODO_INDIVIDUAL, procesos_firma=0, incremental=False, medir_tiempos=False, ruta_metricas=None, callback_progreso=None, control=None):
+    """
+    Genera un diploma por fila del Excel.
+    num_procesos > 1 reparte el renderizado (y la firma) entre varios procesos;
+    el log y los totales se mantienen en el orden de las filas.
+    procesos_firma > 0 (con renderizado secuencial) firma en un pool aparte,
+    solapando el renderizado de unas filas con la firma de las anteriores.
+    modo_salida=MODO_COMBINADO escribe todos los diplomas en un único PDF para imprimir.
+    incremental=True solo regenera (y refirma) las filas cuya huella ha cambiado
+    desde la última ejecución, o cuya firma falló, y borra los PDFs de filas que ya
+    no están en el Excel.
+    medir_tiempos=True añade al final del log una tabla con el tiempo de cada etapa
+    (Excel, plantilla, dibujo, c.save(), firma, escritura); con ruta_metricas se guarda
+    además en ese fichero (JSON Lines). Sin ellos no se mide nada.
+    callback_progreso recibe un progreso.EventoProgreso (filas hechas, total, errores,
+    ritmo y tiempo restante) unas pocas veces por segundo, desde el hilo que genera.
+    control (trabajo.ControlTrabajo) permite pausar o cancelar desde otro hilo; se
+    respeta entre filas y en los procesos del pool. Lo generado hasta entonces queda
+    en el manifiesto, así que relanzar en modo incremental continúa donde se paró.
+    Devuelve (generados, errores).
+    """
+    return metricas.ejecutar("generar", callback_log, medir_tiempos, ruta_metricas, _procesar_excel_y_generar,
+                             excel_path, output_folder, opciones, logo_path, callback_log, datos_firma,
+                             nombre_firmante, num_procesos, modo_salida, procesos_firma, incremental,
+                             callback_progreso, control)
+
+def _procesar_excel_y_generar(excel_path, output_folder, opciones, logo_path, callback_log, datos_firma=None, nombre_firmante=None, num_procesos=1, modo_salida=MODO_INDIVIDUAL, procesos_firma=0, incremental=False, callback_progreso=None, control=None):
+    """Cuerpo de procesar_excel_y_generar (la medición de tiempos la pone el envoltorio)"""
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    df = pd.read_excel(excel_path)
-    df.columns = [c.lower().strip() for c in df.columns]
+    # Cada ejecución vuelve a resolver las plantillas (por si se han movido carpetas)
+    limpiar_cache_plantillas()
+    limpiar_cache_fondos()
+    _CACHE_HUELLAS_PLANTILLA.clear()
+
+    # Las filas se leen en streaming: la primera se genera sin esperar al resto del Excel
+    with metricas.medir("excel"):
+        lector = FilasExcel(excel_path)
 
     # Validar si existe columna id_plantilla, si no, avisar
-    if "id_plantilla" not in df.columns:
+    if "id_plantilla" not in lector.columnas:
         callback_log("ℹ️ Columna 'id_plantilla' no encontrada. Usando plantilla 'default'.")
 
+    # Nombres, ids y validación se calculan por bloques con pandas.
+    # Al cancelar se dejan de leer filas (y en pausa se espera antes de la siguiente)
+    control = control or ControlTrabajo()
+    filas = control.filas(metricas.actual().iterar("excel", preparar_filas(lector)))
+    progreso = Progreso(callback_progreso, lector.total_estimado)
+
+    if modo_salida == MODO_COMBINADO:
+        if incremental:
+            callback_log("ℹ️ El PDF combinado se genera siempre completo (modo incremental ignorado).")
+        generados, errores = _generar_combinado(filas, output_folder, opciones, logo_path, callback_log,
+                                                datos_firma, nombre_firmante, progreso, control)
+        progreso.terminar()
+        if control.cancelado:
+            callback_log("⛔ Cancelado.")
+        callback_log(f"FIN. Generados: {generados} | Errores: {errores}")
+        return generados, errores
+
     generados = 0
     errores = 0
+    sin_cambios = 0
+    nombre_excel = os.path.basename(excel_path)
 
-    for i, row in df.iterrows():
-        try:
-            email = texto_seguro(row.get("email"))
-            curso = texto_seguro(row.get("curso_nombre"))
+    # Registro de lo generado (lo usa el mailer para localizar los PDFs sin escanear la carpeta)
+    manifiesto = Manifiesto(output_folder)
 
-            if not email or "@" not in email:
-                errores += 1
-                continue
+    # Huellas de las filas pendientes de generar: archivo -> huella
+    huellas = {}
+    vistos = set()
 
-            # 1. Identificador del Email
-            id_email = email_a_id(email)
-            
-            # 2. Identificador del Curso (Nuevo)
-            id_curso = limpiar_nombre_curso(curso)
-            
-            # 3. Nombre compuesto único
-            filename = f"{id_email}__{id_curso}.pdf"  # Uso doble guion bajo para separar visualmente
-            
-            ruta_completa = os.path.join(output_folder, filename)
+    # Las huellas se guardan siempre (no solo en modo incremental): así una ejecución
+    # completa que se cancela a medias se puede terminar luego en modo incremental
+    comun = _huella_comun(opciones, datos_firma, nombre_firmante)
 
-            crear_pdf_individual(row, opciones, ruta_completa, logo_path, nombre_firmante)
-            msg_extra = ""
-            
-            # 2. FIRMAR EL PDF (Si toca)
-            if datos_firma:
-                ruta_pfx, pass_pfx = datos_firma
-                ok_firma = firmador.firmar_pdf(ruta_completa, ruta_pfx, pass_pfx)
-                if ok_firma:
-                    msg_extra = " [🔏 FIRMADO]"
-                else:
-                    msg_extra = " [❌ ERROR FIRMA]"
-                    # Opcional: Contar como error o dejarlo pasar sin firmar
-            
-            generados += 1
-            # Añadimos feedback visual al log
-            callback_log(f"Generado: {filename}{msg_extra}") # Si quieres mucho detalle
-            
-        except Exception as e:
-            callback_log(f"[ERROR] Fila {i+2}: {e}")
-            errores += 1
+    def filtrar_sin_cambios(filas):
+        """Calcula la huella de cada fila y, en modo incremental, deja pasar solo las que hay que (re)generar"""
+        nonlocal sin_cambios
+        for fila in filas:
+            if fila.valida:
+                vistos.add(fila.archivo)
+                with metricas.medir("huellas"):
+                    huella = _huella_fila(fila, comun)
+                previa = manifiesto.previas.get(fila.archivo)
+                if (incremental and previa and previa.get("huella") == huella
+                        and os.path.exists(os.path.join(output_folder, fila.archivo))
+                        and (previa.get("firmado") or not datos_firma)):
+                    # Mismo contenido (y firmado si se pide firma): se conserva el PDF y su entrada del manifiesto
+                    manifiesto.registrar(dict(previa, fila=fila.i + 2, excel=nombre_excel))
+                    sin_cambios += 1
+                    progreso.avanzar()
+                    continue
+                huellas[fila.archivo] = huella
+            yield fila
+
+    filas = filtrar_sin_cambios(filas)
 
-    callback_log(f"FIN. Generados: {generados} | Errores: {errores}")
\ No newline at end of file
+    args = (output_folder, opciones, logo_path, datos_firma, nombre_firmante)
+    if num_procesos and num_procesos > 1:
+        callback_log(f"⚙️ Generando en paralelo con {num_procesos} procesos...")
+        tamano_lote = _tamano_lote(lector.total_estimado, num_procesos)
+        resultados = _generar_en_paralelo(filas, num_procesos, tamano_lote, control, *args)
+    elif datos_firma and procesos_firma and procesos_firma > 0:
+        callback_log(f"⚙️ Firmando en paralelo con {procesos_firma} procesos...")
+        resultados = _generar_con_firma_en_paralelo(filas, procesos_firma, control, *args)
+    else:
+        resultados = (_generar_fila(fila, *args) for fila in filas)
+
+    try:
+        for generado, mensaje, entrada in resultados:
+            if generado:
+                generados += 1
+            else:
+                errores += 1
+            metricas.contar("filas")
+            progreso.avanzar(errores=0 if generado else 1)
+            if entrada:
+                entrada["excel"] = nombre_excel
+                huella = huellas.pop(entrada["archivo"], None)
+                if huella:
+                    entrada["huella"] = huella
+                manifiesto.registrar(entrada)
+            if mensaje:
+                callback_log(mensaje) # Si quieres mucho detalle
+
+        if incremental and not control.cancelado:
+            # PDFs de este mismo Excel cuya fila ya no existe (o ya no es válida).
+            # Si se canceló no se sabe: no se han leído todas las filas
+            for archivo, previa in list(manifiesto.previas.items()):
+                if previa.get("excel") == nombre_excel and archivo not in vistos:
+                    try:
+                        os.remove(os.path.join(output_folder, archivo))
+                        callback_log(f"🗑️ Eliminado (ya no está en el Excel): {archivo}")
+                    except FileNotFoundError:
+                        pass
+                    manifiesto.olvidar(archivo)
+    finally:
+        manifiesto.cerrar()
+        progreso.terminar()
+
+    if control.cancelado:
+        callback_log("⛔ Cancelado. Lo generado queda registrado: relanza en modo incremental para continuar.")
+    if incremental:
+        callback_log(f"FIN. Generados: {generados} | Sin cambios: {sin_cambios} | Errores: {errores}")
+    else:
+        callback_log(f"FIN. Generados: {generados} | Errores: {errores}")
+    return generados, errores
\ No newline at end of file
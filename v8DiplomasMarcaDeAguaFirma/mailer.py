@@ -1,17 +1,23 @@
 import os
-import pandas as pd
+import sys
+import time
+import asyncio
+import threading
 import smtplib  # <-- La librería clave para SMTP
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
-
-# --- MANTENEMOS LA LÓGICA DE OUTLOOK ---
-import win32com.client as win32
-import pythoncom
+import importlib.util
 import shutil
 import tempfile
-from utils import email_a_id, limpiar_nombre_curso
+from utils import FilasExcel, preparar_filas, IndicePDFs
+from diario_envios import DiarioEnvios, ENVIADO, ENVIANDO
+import metricas
+from progreso import Progreso
+from trabajo import ControlTrabajo
 
 # --- NUEVO: BASE DE DATOS DE PROVEEDORES SMTP ---
 SMTP_PROVIDERS = {
@@ -32,21 +38,177 @@ SMTP_PROVIDERS = {
     }
 }
 
+_AVISO_CANCELADO = "⛔ Cancelado. Lo enviado queda en el diario: marca 'Reanudar' para continuar."
+
+# --- POOL DE CONEXIONES SMTP ---
+class LimitadorEnvios:
+    """Espacia los envíos para no superar 'mensajes_por_minuto' (None o 0 = sin límite)"""
+    def __init__(self, mensajes_por_minuto=None):
+        self.intervalo = 60.0 / mensajes_por_minuto if mensajes_por_minuto else 0
+        self._siguiente = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        if not self.intervalo:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._siguiente)
+            self._siguiente = turno + self.intervalo
+        if turno > ahora:
+            metricas.actual().sumar("espera_ritmo", turno - ahora)
+            time.sleep(turno - ahora)
+
+class PoolSMTP:
+    """
+    Conexiones SMTP autenticadas compartidas por varios hilos emisores.
+    Cada hilo usa su propia conexión; si el servidor la ha cerrado por inactividad
+    se reconecta y reintenta el envío una vez, sin que el llamador lo note.
+    """
+    def __init__(self, provider_config, user, password, mensajes_por_minuto=None):
+        self.provider_config = provider_config
+        self.user = user
+        self.password = password
+        self.limitador = LimitadorEnvios(mensajes_por_minuto)
+        self._local = threading.local()
+        self._libres = []    # Conexiones abiertas aún sin hilo asignado
+        self._abiertas = []  # Todas, para cerrarlas al final
+        self._lock = threading.Lock()
+
+    def conectar(self):
+        """Abre y autentica una conexión nueva (lanza excepción si falla)"""
+        server = smtplib.SMTP(self.provider_config['server'], self.provider_config['port'], timeout=60)
+        if self.provider_config.get('tls', False):
+            server.starttls() # Iniciar conexión segura
+        server.login(self.user, self.password)
+        with self._lock:
+            self._abiertas.append(server)
+        return server
+
+    def abrir(self):
+        """Abre la primera conexión (sirve para comprobar servidor y contraseña)"""
+        server = self.conectar()
+        with self._lock:
+            self._libres.append(server)
+
+    def _conexion(self):
+        server = getattr(self._local, "server", None)
+        if server is None:
+            with self._lock:
+                server = self._libres.pop() if self._libres else None
+            if server is None:
+                server = self.conectar()
+            self._local.server = server
+        return server
+
+    def _descartar(self, server):
+        with self._lock:
+            if server in self._abiertas:
+                self._abiertas.remove(server)
+        try:
+            server.close()
+        except Exception:
+            pass
+        self._local.server = None
+
+    def enviar(self, msg):
+        self.limitador.esperar()
+        with metricas.medir("smtp"):
+            server = self._conexion()
+            try:
+                server.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # El servidor cerró la conexión (inactividad, límite de sesión...): reconectar
+                metricas.contar("reconexiones")
+                self._descartar(server)
+                self._conexion().send_message(msg)
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code != 421:
+                    raise
+                # 421 = servicio no disponible, cierra la conexión: reconectar
+                metricas.contar("reconexiones")
+                self._descartar(server)
+                self._conexion().send_message(msg)
+
+    def cerrar(self):
+        with self._lock:
+            abiertas, self._abiertas, self._libres = self._abiertas, [], []
+        for server in abiertas:
+            try:
+                server.quit()
+            except Exception:
+                pass
+
+def construir_mensaje(remitente, fila, pdf_path):
+    """Crea el email (HTML + PDF adjunto) de una FilaPreparada"""
+    msg = MIMEMultipart()
+    msg['From'] = remitente
+    msg['To'] = fila.email
+    msg['Subject'] = f"Tu diploma del curso: {fila.curso}"
+
+    # Cuerpo del email
+    body = f"""<p>Hola {fila.nombre},</p>
+               <p>Adjunto te enviamos tu diploma firmado correspondiente al curso <strong>{fila.curso}</strong>.</p>
+               <p>Un saludo.</p>"""
+    msg.attach(MIMEText(body, 'html'))
+
+    # Adjuntar el PDF
+    with open(pdf_path, "rb") as attachment:
+        part = MIMEBase("application", "octet-stream")
+        part.set_payload(attachment.read())
+    
+    encoders.encode_base64(part)
+    
+    # Nombre visible del adjunto
+    nombre_visible_pdf = f"Diploma_{fila.curso_id}.pdf"
+    part.add_header("Content-Disposition", f"attachment; filename= {nombre_visible_pdf}")
+    msg.attach(part)
+    return msg
+
+def abrir_diario(excel_path, reanudar, callback_log):
+    """Abre el diario de envíos del Excel y avisa de lo que queda de la ejecución anterior"""
+    diario = DiarioEnvios(excel_path, reanudar)
+    if reanudar:
+        callback_log(f"♻️ Reanudando envío: {diario.contar(ENVIADO)} destinatarios ya enviados se saltarán.")
+        if diario.contar(ENVIANDO):
+            callback_log(f"⚠️  {diario.contar(ENVIANDO)} envíos se cortaron a medias y se repetirán (podrían llegar duplicados).")
+    elif diario.contar(ENVIADO):
+        callback_log(f"ℹ️ Envío nuevo: se descarta el registro anterior ({diario.contar(ENVIADO)} enviados).")
+    return diario
+
+def _enviar_fila(pool, fila, pdf_path):
+    """Trabajo de un hilo emisor: construye y envía el email de una fila"""
+    with metricas.medir("mensaje"):
+        msg = construir_mensaje(pool.user, fila, pdf_path)
+    pool.enviar(msg)
+
 # --- NUEVA FUNCIÓN DE ENVÍO POR SMTP ---
-def enviar_masivo_smtp(provider_config, user, password, excel_path, pdf_folder, callback_log):
+def enviar_masivo_smtp(provider_config, user, password, excel_path, pdf_folder, callback_log, conexiones=1, mensajes_por_minuto=None, reanudar=False, medir_tiempos=False, ruta_metricas=None, callback_progreso=None, control=None):
     """
     Motor de envío masivo usando el protocolo SMTP.
     provider_config: Un diccionario con 'server', 'port', 'tls'.
+    conexiones: hilos emisores, cada uno con su conexión autenticada.
+    mensajes_por_minuto: tope de envíos para respetar la cuota del proveedor (None = sin límite).
+    reanudar: salta a los destinatarios que el diario de envíos da como ya enviados.
+    medir_tiempos / ruta_metricas: tabla de tiempos por etapa al final del log (y en fichero).
+    callback_progreso: recibe progreso.EventoProgreso (filas, total, errores, ritmo, ETA).
+    control: trabajo.ControlTrabajo para pausar o cancelar entre destinatarios; con
+    reanudar=True la siguiente ejecución sigue donde se paró.
+    Devuelve (enviados, errores), o None si no se pudo conectar.
     """
+    return metricas.ejecutar("enviar", callback_log, medir_tiempos, ruta_metricas, _enviar_masivo_smtp,
+                             provider_config, user, password, excel_path, pdf_folder, callback_log,
+                             conexiones, mensajes_por_minuto, reanudar, callback_progreso, control)
+
+def _enviar_masivo_smtp(provider_config, user, password, excel_path, pdf_folder, callback_log, conexiones=1, mensajes_por_minuto=None, reanudar=False, callback_progreso=None, control=None):
+    """Cuerpo de enviar_masivo_smtp"""
+    conexiones = max(1, conexiones or 1)
+    pool = PoolSMTP(provider_config, user, password, mensajes_por_minuto)
     try:
-        # 1. Conectar al servidor
+        # 1. Conectar al servidor e iniciar sesión
         callback_log(f"🔌 Conectando a {provider_config['server']}...")
-        server = smtplib.SMTP(provider_config['server'], provider_config['port'])
-        if provider_config.get('tls', False):
-            server.starttls() # Iniciar conexión segura
-        
-        # 2. Iniciar sesión
-        server.login(user, password)
+        with metricas.medir("login"):
+            pool.abrir()
         callback_log("✅ Login SMTP correcto.")
         
     except Exception as e:
@@ -55,76 +217,340 @@ def enviar_masivo_smtp(provider_config, user, password, excel_path, pdf_folder,
         callback_log("   Si usas 2FA, necesitas una 'Contraseña de Aplicación'.")
         return
 
-    df = pd.read_excel(excel_path)
-    df.columns = [c.lower().strip() for c in df.columns]
-    
+    if conexiones > 1:
+        callback_log(f"⚙️ Enviando con {conexiones} conexiones simultáneas...")
+
     enviados = 0
     errores = 0
+    saltados = 0
+    diario = abrir_diario(excel_path, reanudar, callback_log)
+    control = control or ControlTrabajo()
+
+    def recoger(fila, futuro):
+        nonlocal enviados, errores
+        if control.cancelado and futuro.cancel():
+            # No llegó a salir: queda pendiente para cuando se reanude
+            diario.error(fila, "Cancelado")
+            return
+        try:
+            futuro.result()
+            with metricas.medir("diario"):
+                diario.enviado(fila)
+            callback_log(f"🚀 [ENVIADO SMTP] a {fila.email}")
+            enviados += 1
+            progreso.avanzar()
+        except Exception as e:
+            diario.error(fila, e)
+            callback_log(f"[ERROR SMTP] Fila {fila.i+2}: {e}")
+            errores += 1
+            progreso.avanzar(errores=1)
 
-    for idx, row in df.iterrows():
+    # Un único escaneo de la carpeta (o el manifiesto del generador) para todo el envío
+    with metricas.medir("indice_pdfs"):
+        indice = IndicePDFs(pdf_folder)
+    if indice.desde_manifiesto:
+        callback_log("📒 PDFs localizados con el manifiesto del generador.")
+
+    try:
+        with ThreadPoolExecutor(max_workers=conexiones) as emisores:
+            en_vuelo = deque()
+            with metricas.medir("excel"):
+                lector = FilasExcel(excel_path)
+            progreso = Progreso(callback_progreso, lector.total_estimado)
+            for fila in control.filas(metricas.actual().iterar("excel", preparar_filas(lector))):
+                try:
+                    if not fila.valida:
+                        progreso.avanzar()
+                        continue
+
+                    if diario.ya_enviado(fila):
+                        saltados += 1
+                        progreso.avanzar()
+                        continue
+
+                    pdf_path = buscar_pdf_especifico(pdf_folder, fila.email_id, fila.curso_id, indice)
+
+                    if not pdf_path:
+                        callback_log(f"⚠️  No encuentro PDF para: {fila.email} del curso '{fila.curso}'")
+                        diario.error(fila, "No se encuentra el PDF")
+                        errores += 1
+                        progreso.avanzar(errores=1)
+                        continue
+
+                    with metricas.medir("diario"):
+                        diario.enviando(fila)
+                    en_vuelo.append((fila, emisores.submit(_enviar_fila, pool, fila, pdf_path)))
+
+                except Exception as e:
+                    callback_log(f"[ERROR SMTP] Fila {fila.i+2}: {e}")
+                    errores += 1
+                    progreso.avanzar(errores=1)
+
+                # Cola acotada: el log sale en el orden del Excel
+                while len(en_vuelo) > conexiones * 4:
+                    recoger(*en_vuelo.popleft())
+            while en_vuelo:
+                recoger(*en_vuelo.popleft())
+            progreso.terminar()
+    finally:
+        pool.cerrar()
+        diario.cerrar()
+
+    if control.cancelado:
+        callback_log(_AVISO_CANCELADO)
+    if reanudar:
+        callback_log(f"FIN SMTP. Enviados: {enviados} | Ya enviados antes: {saltados} | Errores: {errores}")
+    else:
+        callback_log(f"FIN SMTP. Enviados: {enviados} | Errores: {errores}")
+    return enviados, errores
+
+
+# --- MOTOR DE ENVÍO ASÍNCRONO (asyncio + aiosmtplib) ---
+def _es_error_temporal(e):
+    """Errores tras los que merece la pena reconectar y reintentar"""
+    import aiosmtplib
+    if isinstance(e, (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError,
+                      aiosmtplib.SMTPTimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(e, aiosmtplib.SMTPRecipientsRefused):
+        return False
+    return isinstance(e, aiosmtplib.SMTPResponseException) and 400 <= e.code < 500
+
+async def _motor_smtp_async(provider_config, user, password, filas, pdf_folder, callback_log,
+                            conexiones, reintentos, mensajes_por_minuto, abrir_diario_envios, progreso, control):
+    import aiosmtplib
+
+    async def conectar():
+        smtp = aiosmtplib.SMTP(hostname=provider_config['server'], port=provider_config['port'],
+                               start_tls=bool(provider_config.get('tls', False)), timeout=60)
+        await smtp.connect()
+        await smtp.login(user, password)
+        return smtp
+
+    async def cerrar(smtp):
+        if smtp is None:
+            return
         try:
-            email_dest = str(row["email"]).strip()
-            nombre = str(row.get("nombre", "")).strip()
-            curso_raw = str(row.get("curso_nombre", "")).strip()
+            await smtp.quit()
+        except Exception:
+            smtp.close()
 
-            if "@" not in email_dest:
-                continue
+    # 1. Primera conexión: comprueba servidor y contraseña antes de leer el Excel
+    try:
+        callback_log(f"🔌 Conectando a {provider_config['server']} (motor asíncrono)...")
+        with metricas.medir("login"):
+            primera = await conectar()
+        callback_log("✅ Login SMTP correcto.")
+    except Exception as e:
+        callback_log(f"❌ ERROR DE CONEXIÓN/LOGIN SMTP: {e}")
+        callback_log("   Asegúrate de que la contraseña es correcta.")
+        callback_log("   Si usas 2FA, necesitas una 'Contraseña de Aplicación'.")
+        return
 
-            email_id = email_a_id(email_dest)
-            curso_id = limpiar_nombre_curso(curso_raw).lower()
-            
-            pdf_path = buscar_pdf_especifico(pdf_folder, email_id, curso_id)
+    # Como en el motor con hilos, el diario se abre tras el login: si falla la
+    # conexión, el diario de un envío anterior sigue intacto aunque no se reanude
+    diario = abrir_diario_envios()
 
-            if not pdf_path:
-                callback_log(f"⚠️  No encuentro PDF para: {email_dest} del curso '{curso_raw}'")
-                errores += 1
-                continue
+    loop = asyncio.get_running_loop()
+    intervalo = 60.0 / mensajes_por_minuto if mensajes_por_minuto else 0
+    siguiente_turno = loop.time()
 
-            # Crear el mensaje
-            msg = MIMEMultipart()
-            msg['From'] = user
-            msg['To'] = email_dest
-            msg['Subject'] = f"Tu diploma del curso: {curso_raw}"
-
-            # Cuerpo del email
-            body = f"""<p>Hola {nombre},</p>
-                       <p>Adjunto te enviamos tu diploma firmado correspondiente al curso <strong>{curso_raw}</strong>.</p>
-                       <p>Un saludo.</p>"""
-            msg.attach(MIMEText(body, 'html'))
-
-            # Adjuntar el PDF
-            with open(pdf_path, "rb") as attachment:
-                part = MIMEBase("application", "octet-stream")
-                part.set_payload(attachment.read())
-            
-            encoders.encode_base64(part)
-            
-            # Nombre visible del adjunto
-            curso_limpio = limpiar_nombre_curso(curso_raw)
-            nombre_visible_pdf = f"Diploma_{curso_limpio}.pdf"
-            part.add_header("Content-Disposition", f"attachment; filename= {nombre_visible_pdf}")
-            msg.attach(part)
-            
-            # Enviar
-            server.send_message(msg)
-            callback_log(f"🚀 [ENVIADO SMTP] a {email_dest}")
-            enviados += 1
+    enviados = 0
+    errores = 0
+    intentos = {}  # fila.archivo -> intentos fallidos (estado de reintento por destinatario)
+    cola = asyncio.Queue(maxsize=conexiones * 4)
 
-        except Exception as e:
-            callback_log(f"[ERROR SMTP] Fila {idx+2}: {e}")
+    async def esperar_turno():
+        nonlocal siguiente_turno
+        if not intervalo:
+            return
+        ahora = loop.time()
+        turno = max(ahora, siguiente_turno)
+        siguiente_turno = turno + intervalo
+        if turno > ahora:
+            metricas.actual().sumar("espera_ritmo", turno - ahora)
+            await asyncio.sleep(turno - ahora)
+
+    def fallo(fila, e):
+        nonlocal errores
+        diario.error(fila, e)
+        callback_log(f"[ERROR SMTP] Fila {fila.i+2}: {e}")
+        errores += 1
+        progreso.avanzar(errores=1)
+
+    async def emisor(smtp):
+        nonlocal enviados
+        while True:
+            trabajo = await cola.get()
+            if trabajo is None:
+                break
+            fila, pdf_path = trabajo
+            if not await control.seguir_async():
+                # Cancelado con el mensaje aún en la cola: queda pendiente para cuando se reanude
+                diario.error(fila, "Cancelado")
+                continue
+            try:
+                with metricas.medir("mensaje"):
+                    msg = construir_mensaje(user, fila, pdf_path)
+            except Exception as e:
+                # P.ej. el PDF se borró después de indexar la carpeta
+                fallo(fila, e)
+                continue
+            while True:
+                try:
+                    if smtp is None:
+                        smtp = await conectar()
+                    await esperar_turno()
+                    with metricas.medir("smtp"):
+                        await smtp.send_message(msg)
+                    with metricas.medir("diario"):
+                        diario.enviado(fila)
+                    callback_log(f"🚀 [ENVIADO SMTP] a {fila.email}")
+                    enviados += 1
+                    progreso.avanzar()
+                    break
+                except Exception as e:
+                    fallos = intentos[fila.archivo] = intentos.get(fila.archivo, 0) + 1
+                    if not _es_error_temporal(e) or fallos >= reintentos or control.cancelado:
+                        fallo(fila, e)
+                        break
+                    # Conexión caída o error temporal: reconectar tras una espera creciente
+                    callback_log(f"🔁 Reintento {fallos}/{reintentos - 1} para {fila.email}: {e}")
+                    metricas.contar("reintentos")
+                    await cerrar(smtp)
+                    smtp = None
+                    espera = min(2 ** fallos, 30)
+                    metricas.actual().sumar("espera_reintento", espera)
+                    await asyncio.sleep(espera)
+        await cerrar(smtp)
+
+    with metricas.medir("indice_pdfs"):
+        indice = IndicePDFs(pdf_folder)
+    if indice.desde_manifiesto:
+        callback_log("📒 PDFs localizados con el manifiesto del generador.")
+    tareas = [asyncio.create_task(emisor(primera if n == 0 else None)) for n in range(conexiones)]
+
+    def comprobar_emisores():
+        # Un emisor solo termina bien al recibir None: si acaba con una excepción, se para todo
+        for tarea in tareas:
+            if tarea.done() and (tarea.cancelled() or tarea.exception() is not None):
+                for otra in tareas:
+                    otra.cancel()
+                error = None if tarea.cancelled() else tarea.exception()
+                callback_log(f"❌ Un emisor SMTP se ha detenido: {error}")
+                raise error or RuntimeError("Emisor SMTP cancelado")
+
+    async def repartir(trabajo):
+        """cola.put que no se queda esperando para siempre si los emisores han caído"""
+        comprobar_emisores()
+        if not cola.full():
+            cola.put_nowait(trabajo)
+            return
+        puesta = asyncio.ensure_future(cola.put(trabajo))
+        while not puesta.done():
+            await asyncio.wait([puesta, *(t for t in tareas if not t.done())], return_when=asyncio.FIRST_COMPLETED)
+            if not puesta.done():
+                try:
+                    comprobar_emisores()
+                except BaseException:
+                    puesta.cancel()
+                    raise
+
+    # 2. Productor: lee el Excel y reparte el trabajo mientras los emisores envían
+    saltados = 0
+    for fila in metricas.actual().iterar("excel", filas):
+        if not await control.seguir_async():
+            break
+        if not fila.valida:
+            progreso.avanzar()
+            continue
+        if diario.ya_enviado(fila):
+            saltados += 1
+            progreso.avanzar()
+            continue
+        pdf_path = buscar_pdf_especifico(pdf_folder, fila.email_id, fila.curso_id, indice)
+        if not pdf_path:
+            callback_log(f"⚠️  No encuentro PDF para: {fila.email} del curso '{fila.curso}'")
+            diario.error(fila, "No se encuentra el PDF")
             errores += 1
-            
-    server.quit()
-    callback_log(f"FIN SMTP. Enviados: {enviados} | Errores: {errores}")
+            progreso.avanzar(errores=1)
+            continue
+        with metricas.medir("diario"):
+            diario.enviando(fila)
+        await repartir((fila, pdf_path))
+
+    for _ in tareas:
+        await repartir(None)
+    await asyncio.gather(*tareas)
+    progreso.terminar()
+
+    if control.cancelado:
+        callback_log(_AVISO_CANCELADO)
+    if diario.reanudar:
+        callback_log(f"FIN SMTP. Enviados: {enviados} | Ya enviados antes: {saltados} | Errores: {errores}")
+    else:
+        callback_log(f"FIN SMTP. Enviados: {enviados} | Errores: {errores}")
+    return enviados, errores
+
+def enviar_masivo_smtp_async(provider_config, user, password, excel_path, pdf_folder, callback_log, conexiones=4, reintentos=3, mensajes_por_minuto=None, reanudar=False, medir_tiempos=False, ruta_metricas=None, callback_progreso=None, control=None):
+    """
+    Alternativa asíncrona a enviar_masivo_smtp para envíos muy grandes: varias
+    conexiones SMTP con mensajes en vuelo a la vez, reintentos por destinatario
+    (con reconexión), el mismo diario de envíos, callback_log, callback_progreso y control. Requiere 'aiosmtplib'.
+    Bloquea hasta terminar, así que se llama desde un hilo igual que la versión clásica.
+    Devuelve (enviados, errores), o None si no se pudo conectar.
+    """
+    return metricas.ejecutar("enviar", callback_log, medir_tiempos, ruta_metricas, _enviar_masivo_smtp_async,
+                             provider_config, user, password, excel_path, pdf_folder, callback_log,
+                             conexiones, reintentos, mensajes_por_minuto, reanudar, callback_progreso, control)
+
+def _enviar_masivo_smtp_async(provider_config, user, password, excel_path, pdf_folder, callback_log, conexiones=4, reintentos=3, mensajes_por_minuto=None, reanudar=False, callback_progreso=None, control=None):
+    """Cuerpo de enviar_masivo_smtp_async"""
+    try:
+        import aiosmtplib  # noqa: F401
+    except ImportError:
+        callback_log("❌ El motor asíncrono necesita la librería 'aiosmtplib' (pip install aiosmtplib).")
+        return
 
+    with metricas.medir("excel"):
+        lector = FilasExcel(excel_path)
+    filas = preparar_filas(lector)
+    progreso = Progreso(callback_progreso, lector.total_estimado)
+    diarios = []
 
-def enviar_masivo_outlook(excel_path, pdf_folder, dry_run, callback_log):
+    def abrir_diario_envios():
+        diarios.append(abrir_diario(excel_path, reanudar, callback_log))
+        return diarios[-1]
+
+    try:
+        return asyncio.run(_motor_smtp_async(provider_config, user, password, filas, pdf_folder, callback_log,
+                                             max(1, conexiones or 1), max(1, reintentos), mensajes_por_minuto,
+                                             abrir_diario_envios, progreso, control or ControlTrabajo()))
+    finally:
+        for diario in diarios:
+            diario.cerrar()
+
+
+def enviar_masivo_outlook(excel_path, pdf_folder, dry_run, callback_log, reanudar=False, medir_tiempos=False, ruta_metricas=None, callback_progreso=None, control=None):
     """
     Lógica original usando Outlook de escritorio (Classic).
     dry_run = True -> mail.Display() (abre la ventana)
-    dry_run = False -> mail.Send() (envía directo)
+    dry_run = False -> mail.Send() (envía directo, anotando cada envío en el diario)
+    medir_tiempos / ruta_metricas: tabla de tiempos por etapa al final del log (y en fichero).
+    callback_progreso: recibe progreso.EventoProgreso (filas, total, errores, ritmo, ETA).
+    control: trabajo.ControlTrabajo para pausar o cancelar entre destinatarios.
+    Devuelve (enviados, errores), o None si no se pudo empezar (sin Excel, sin Outlook...).
     """
-    
+    return metricas.ejecutar("enviar", callback_log, medir_tiempos, ruta_metricas, _enviar_masivo_outlook,
+                             excel_path, pdf_folder, dry_run, callback_log, reanudar, callback_progreso, control)
+
+def _enviar_masivo_outlook(excel_path, pdf_folder, dry_run, callback_log, reanudar=False, callback_progreso=None, control=None):
+    """Cuerpo de enviar_masivo_outlook"""
+    if not motor_disponible("outlook"):
+        callback_log("❌ El envío por Outlook solo está disponible en Windows (pywin32).")
+        return
+    win32, pythoncom = _cargar_outlook()
+
     # IMPORTANTE: Inicializar COM en este hilo
     pythoncom.CoInitialize()
 
@@ -133,11 +559,12 @@ def enviar_masivo_outlook(excel_path, pdf_folder, dry_run, callback_log):
             callback_log("❌ Error: No se encuentra el Excel.")
             return
 
-        df = pd.read_excel(excel_path)
-        df.columns = [c.lower().strip() for c in df.columns]
+        with metricas.medir("excel"):
+            filas = FilasExcel(excel_path)
 
         # Verificar columnas
-        if "email" not in df.columns:
+        if "email" not in filas.columnas:
+            filas.cerrar()
             callback_log("❌ Error: El Excel no tiene columna 'email'.")
             return
 
@@ -151,24 +578,42 @@ def enviar_masivo_outlook(excel_path, pdf_folder, dry_run, callback_log):
 
         enviados = 0
         errores = 0
+        saltados = 0
         
         callback_log(f"Iniciando proceso... (Modo Prueba: {dry_run})")
 
-        for idx, row in df.iterrows():
+        # Los borradores del modo prueba no cuentan como enviados
+        diario = None if dry_run else abrir_diario(excel_path, reanudar, callback_log)
+
+        # Un único escaneo de la carpeta (o el manifiesto del generador) para todo el envío
+        with metricas.medir("indice_pdfs"):
+            indice = IndicePDFs(pdf_folder)
+        if indice.desde_manifiesto:
+            callback_log("📒 PDFs localizados con el manifiesto del generador.")
+
+        progreso = Progreso(callback_progreso, filas.total_estimado)
+        control = control or ControlTrabajo()
+        for fila in control.filas(metricas.actual().iterar("excel", preparar_filas(filas))):
+            errores_antes = errores
             try:
-                email = str(row["email"]).strip()
-                nombre = str(row.get("nombre", "")).strip()
-                curso_raw = str(row.get("curso_nombre", "")).strip()
-                if "@" not in email: continue
+                email = fila.email
+                nombre = fila.nombre
+                curso_raw = fila.curso
+                if not fila.valida: continue
+                if diario and diario.ya_enviado(fila):
+                    saltados += 1
+                    continue
 
-                email_id = email_a_id(email)
-                curso_id = limpiar_nombre_curso(curso_raw).lower()
+                email_id = fila.email_id
+                curso_id = fila.curso_id.lower()
                 
                 # 1. Encontrar el PDF original
-                pdf_original_path = buscar_pdf_especifico(pdf_folder, email_id, curso_id)
+                pdf_original_path = buscar_pdf_especifico(pdf_folder, email_id, curso_id, indice)
 
                 if not pdf_original_path:
                     callback_log(f"⚠️ [ERROR] No encuentro PDF para: {email} del curso '{curso_raw}'")
+                    if diario:
+                        diario.error(fila, "No se encuentra el PDF")
                     errores += 1
                     continue
 
@@ -185,8 +630,7 @@ def enviar_masivo_outlook(excel_path, pdf_folder, dry_run, callback_log):
                 # --- LÓGICA DE RENOMBRADO UNIVERSAL ---
                 with tempfile.TemporaryDirectory() as temp_dir:
                     # 2. Crear nombre de archivo bonito
-                    curso_limpio = limpiar_nombre_curso(curso_raw)
-                    nombre_visible_pdf = f"Diploma_{curso_limpio}.pdf"
+                    nombre_visible_pdf = f"Diploma_{fila.curso_id}.pdf"
                     
                     # 3. Ruta del archivo temporal
                     ruta_temp_pdf = os.path.join(temp_dir, nombre_visible_pdf)
@@ -195,7 +639,8 @@ def enviar_masivo_outlook(excel_path, pdf_folder, dry_run, callback_log):
                     shutil.copy2(pdf_original_path, ruta_temp_pdf)
                     
                     # 5. Adjuntar la copia con el nombre correcto
-                    mail.Attachments.Add(ruta_temp_pdf)
+                    with metricas.medir("adjunto"):
+                        mail.Attachments.Add(ruta_temp_pdf)
 
                     # Ya no necesitamos DisplayName, el nombre del archivo es el correcto.
 
@@ -204,47 +649,71 @@ def enviar_masivo_outlook(excel_path, pdf_folder, dry_run, callback_log):
                         callback_log(f"🔭 [PRUEBA] Abriendo borrador para {email} con adjunto '{nombre_visible_pdf}'...")
                         mail.Display()
                     else:
-                        mail.Send()
+                        diario.enviando(fila)
+                        with metricas.medir("outlook"):
+                            mail.Send()
+                        diario.enviado(fila)
                         callback_log(f"🚀 [ENVIADO] {email} (Curso: {curso_raw})")
                         enviados += 1
 
             except Exception as e:
-                callback_log(f"[ERROR] Fila {idx+2}: {e}")
+                callback_log(f"[ERROR] Fila {fila.i+2}: {e}")
+                if diario:
+                    diario.error(fila, e)
                 errores += 1
+            finally:
+                progreso.avanzar(errores=errores - errores_antes)
+        progreso.terminar()
 
+        if diario:
+            diario.cerrar()
         callback_log("-" * 30)
-        callback_log(f"FIN PROCESO. Enviados: {enviados} | Errores: {errores}")
+        if control.cancelado:
+            callback_log(_AVISO_CANCELADO)
+        if saltados:
+            callback_log(f"FIN PROCESO. Enviados: {enviados} | Ya enviados antes: {saltados} | Errores: {errores}")
+        else:
+            callback_log(f"FIN PROCESO. Enviados: {enviados} | Errores: {errores}")
+        return enviados, errores
 
     finally:
         # Liberar recursos COM
         pythoncom.CoUninitialize()
         
-def buscar_pdf_especifico(carpeta, email_id, curso_id):
+def buscar_pdf_especifico(carpeta, email_id, curso_id, indice=None):
     """
-    Busca un archivo que contenga TANTO el email_id COMO el curso_id.
+    Busca el PDF de ese email_id y ese curso_id.
     Ejemplo busca: juan_perez + Curso_Python
     Archivo real: juan_perez__Curso_Python.pdf
+    Para envíos masivos se pasa un IndicePDFs (la carpeta se escanea una sola vez).
     """
-    if not os.path.exists(carpeta):
-        return None
-
-    candidatos = []
-    
-    for f in os.listdir(carpeta):
-        if not f.lower().endswith(".pdf"):
-            continue
-            
-        # El archivo debe contener AMBAS partes
-        # Usamos lower() para evitar problemas de mayúsculas/minúsculas
-        nombre_archivo = f.lower()
-        
-        if email_id in nombre_archivo and curso_id in nombre_archivo:
-            ruta = os.path.join(carpeta, f)
-            candidatos.append(ruta)
-
-    if not candidatos:
-        return None
-
-    # Si por algún motivo hay duplicados, cogemos el más reciente
-    candidatos.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-    return candidatos[0]
\ No newline at end of file
+    if indice is None:
+        indice = IndicePDFs(carpeta)
+    # Si por algún motivo hay duplicados, el índice guarda el más reciente
+    return indice.buscar(email_id, curso_id)
+
+# --- REGISTRO DE MOTORES DE ENVÍO ---
+# Solo se registran los motores que pueden funcionar en esta máquina (Outlook solo en
+# Windows con pywin32). Sus librerías se importan al usarlos, no al importar mailer.
+MOTORES_ENVIO = {}  # nombre -> función de envío
+
+def _hay_modulo(nombre):
+    """Si el módulo está instalado, sin llegar a importarlo"""
+    return importlib.util.find_spec(nombre) is not None
+
+def registrar_motor(nombre, funcion, disponible=True):
+    if disponible:
+        MOTORES_ENVIO[nombre] = funcion
+
+def motor_disponible(nombre):
+    return nombre in MOTORES_ENVIO
+
+def _cargar_outlook():
+    """pywin32 se importa la primera vez que se envía por Outlook"""
+    import win32com.client as win32
+    import pythoncom
+    return win32, pythoncom
+
+registrar_motor("smtp", enviar_masivo_smtp)
+registrar_motor("smtp_async", enviar_masivo_smtp_async, _hay_modulo("aiosmtplib"))
+registrar_motor("outlook", enviar_masivo_outlook, sys.platform == "win32" and _hay_modulo("win32com"))
@@ -0,0 +1,79 @@
+import os
+import json
+import hashlib
+import datetime
+
+# Se guarda dentro de la carpeta de diplomas (Diplomas_Generados)
+NOMBRE_MANIFIESTO = "manifiesto.jsonl"
+
+def ruta_manifiesto(carpeta):
+    return os.path.join(carpeta, NOMBRE_MANIFIESTO)
+
+def crear_entrada(fila, plantilla, contenido, firmado):
+    """
+    Entrada del manifiesto para el PDF de una FilaPreparada.
+    'contenido' son los bytes finales tal y como se escribieron en disco.
+    """
+    return {
+        "fila": fila.i + 2,
+        "email": fila.email,
+        "curso": fila.curso,
+        "plantilla": plantilla,
+        "archivo": fila.archivo,
+        "bytes": len(contenido),
+        "sha256": hashlib.sha256(contenido).hexdigest(),
+        "firmado": bool(firmado),
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+def leer_manifiesto(carpeta):
+    """
+    Devuelve {archivo: entrada} con el estado registrado de la carpeta
+    (si un archivo aparece varias veces, gana la última línea). {} si no hay manifiesto.
+    """
+    entradas = {}
+    ruta = ruta_manifiesto(carpeta)
+    if not os.path.exists(ruta):
+        return entradas
+
+    with open(ruta, "r", encoding="utf-8") as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                entrada = json.loads(linea)
+            except ValueError:
+                continue # Línea cortada (p.ej. si se fue la luz a mitad de escritura)
+            if entrada.get("archivo"):
+                entradas[entrada["archivo"]] = entrada
+    return entradas
+
+class Manifiesto:
+    """
+    Manifiesto de una ejecución del generador (JSON Lines, una línea por PDF).
+    Las entradas nuevas se van escribiendo en un temporal y al cerrar se publica
+    el manifiesto completo de golpe (os.replace): lo generado ahora más lo que
+    ya estaba registrado de ejecuciones anteriores y sigue existiendo en disco.
+    """
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        self.ruta = ruta_manifiesto(carpeta)
+        self.previas = leer_manifiesto(carpeta)
+        self.nuevas = {}
+        self._temp = open(self.ruta + ".tmp", "w", encoding="utf-8")
+
+    def registrar(self, entrada):
+        self.nuevas[entrada["archivo"]] = entrada
+        self._temp.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+
+    def olvidar(self, archivo):
+        """Quita del manifiesto una entrada de una ejecución anterior (p.ej. un PDF borrado)"""
+        self.previas.pop(archivo, None)
+
+    def cerrar(self):
+        for archivo, entrada in self.previas.items():
+            if archivo not in self.nuevas and os.path.exists(os.path.join(self.carpeta, archivo)):
+                self._temp.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+        self._temp.close()
+        os.replace(self.ruta + ".tmp", self.ruta)
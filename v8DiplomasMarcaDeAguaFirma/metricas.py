@@ -0,0 +1,186 @@
+import json
+import time
+import datetime
+import threading
+from contextlib import nullcontext
+
+# Cronómetros por etapa (leer Excel, dibujar, c.save(), firmar, SMTP...) para saber
+# en qué se va el tiempo de un lote lento. Desactivado por defecto: mientras no se
+# llame a activar(), medir() devuelve siempre el mismo contexto vacío y no se mide nada.
+#
+#   with metricas.medir("firma"):
+#       ...
+
+class Metricas:
+    """Tiempo acumulado y número de veces de cada etapa, más contadores sueltos"""
+    def __init__(self):
+        self.etapas = {}       # etapa -> [segundos, veces]
+        self.contadores = {}   # nombre -> valor
+        self.inicio = time.perf_counter()
+        self._lock = threading.Lock()  # El motor SMTP mide desde varios hilos
+
+    def sumar(self, etapa, segundos, veces=1):
+        with self._lock:
+            acumulado = self.etapas.get(etapa)
+            if acumulado is None:
+                self.etapas[etapa] = [segundos, veces]
+            else:
+                acumulado[0] += segundos
+                acumulado[1] += veces
+
+    def contar(self, nombre, n=1):
+        with self._lock:
+            self.contadores[nombre] = self.contadores.get(nombre, 0) + n
+
+    def medir(self, etapa):
+        return _Cronometro(self, etapa)
+
+    def iterar(self, etapa, iterable):
+        """Recorre 'iterable' midiendo lo que tarda en dar cada elemento (p.ej. leer filas del Excel)"""
+        iterador = iter(iterable)
+        while True:
+            t = time.perf_counter()
+            try:
+                elemento = next(iterador)
+            except StopIteration:
+                self.sumar(etapa, time.perf_counter() - t, 0)
+                return
+            self.sumar(etapa, time.perf_counter() - t)
+            yield elemento
+
+    def exportar(self):
+        """Tiempos en un formato que se puede devolver desde un proceso del pool"""
+        with self._lock:
+            return {"etapas": {e: list(v) for e, v in self.etapas.items()}, "contadores": dict(self.contadores)}
+
+    def combinar(self, exportado):
+        """Suma lo medido en otro proceso"""
+        for etapa, (segundos, veces) in exportado["etapas"].items():
+            self.sumar(etapa, segundos, veces)
+        for nombre, n in exportado["contadores"].items():
+            self.contar(nombre, n)
+
+    def tabla(self):
+        """Líneas de texto con el resumen por etapa (para el callback_log)"""
+        total = time.perf_counter() - self.inicio
+        suma = sum(s for s, _ in self.etapas.values()) or 1
+        lineas = [
+            "⏱️ Tiempos por etapa:",
+            f"   {'etapa':<14}{'total s':>9}{'veces':>8}{'media ms':>10}{'%':>6}",
+        ]
+        for etapa, (segundos, veces) in sorted(self.etapas.items(), key=lambda e: -e[1][0]):
+            media = segundos * 1000 / veces if veces else 0
+            lineas.append(f"   {etapa:<14}{segundos:9.2f}{veces:8d}{media:10.2f}{segundos * 100 / suma:5.0f}%")
+        lineas.append(f"   {'reloj':<14}{total:9.2f}")
+        if self.contadores:
+            lineas.append("   " + " | ".join(f"{n}: {v}" for n, v in sorted(self.contadores.items())))
+        return lineas
+
+    def guardar(self, ruta, proceso):
+        """Añade una línea JSON con esta ejecución al fichero de métricas"""
+        registro = {
+            "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+            "proceso": proceso,
+            "segundos": time.perf_counter() - self.inicio,
+            **self.exportar(),
+        }
+        with open(ruta, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+class _Cronometro:
+    __slots__ = ("metricas", "etapa", "t")
+
+    def __init__(self, metricas, etapa):
+        self.metricas = metricas
+        self.etapa = etapa
+
+    def __enter__(self):
+        self.t = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metricas.sumar(self.etapa, time.perf_counter() - self.t)
+        return False
+
+class _SinMetricas:
+    """Sustituto cuando no se mide: no hace nada"""
+    _NADA = nullcontext()
+
+    def medir(self, etapa):
+        return self._NADA
+
+    def sumar(self, etapa, segundos, veces=1):
+        pass
+
+    def contar(self, nombre, n=1):
+        pass
+
+    def iterar(self, etapa, iterable):
+        return iterable
+
+SIN_METRICAS = _SinMetricas()
+
+# Métricas de la ejecución en curso en este proceso
+_actual = SIN_METRICAS
+
+def activar():
+    global _actual
+    _actual = Metricas()
+    return _actual
+
+def desactivar():
+    global _actual
+    _actual = SIN_METRICAS
+
+def actual():
+    return _actual
+
+def medir(etapa):
+    return _actual.medir(etapa)
+
+def contar(nombre, n=1):
+    _actual.contar(nombre, n)
+
+def medido(funcion, *args):
+    """
+    Ejecuta funcion(*args) en un proceso del pool midiendo sus etapas.
+    Devuelve (resultado, tiempos exportados) para combinarlos en el proceso principal.
+    """
+    activar()
+    try:
+        return funcion(*args), _actual.exportar()
+    finally:
+        desactivar()
+
+def lanzar(pool, funcion, *args):
+    """pool.submit que, si se están midiendo tiempos, mide también dentro del proceso hijo"""
+    if _actual is SIN_METRICAS:
+        return pool.submit(funcion, *args)
+    return pool.submit(medido, funcion, *args)
+
+def recoger(futuro):
+    """futuro.result() de algo lanzado con lanzar(), sumando los tiempos del proceso hijo"""
+    if _actual is SIN_METRICAS:
+        return futuro.result()
+    resultado, tiempos = futuro.result()
+    _actual.combinar(tiempos)
+    return resultado
+
+def ejecutar(proceso, callback_log, medir_tiempos, ruta_metricas, funcion, *args, **kwargs):
+    """
+    Ejecuta funcion(*args, **kwargs). Si se pide (medir_tiempos o ruta_metricas) mide sus
+    etapas, escribe la tabla resumen en el callback_log y, con ruta_metricas, añade la
+    ejecución a ese fichero. Si no, la llama sin más.
+    """
+    if not (medir_tiempos or ruta_metricas):
+        return funcion(*args, **kwargs)
+
+    medidas = activar()
+    try:
+        return funcion(*args, **kwargs)
+    finally:
+        desactivar()
+        for linea in medidas.tabla():
+            callback_log(linea)
+        if ruta_metricas:
+            medidas.guardar(ruta_metricas, proceso)
@@ -0,0 +1,62 @@
+import time
+from collections import deque, namedtuple
+
+# Progreso de un trabajo largo (generar o enviar) para la interfaz o la línea de comandos.
+# El generador y el mailer reciben un callback_progreso opcional y le van pasando
+# EventoProgreso; quien lo recibe decide cómo pintarlo.
+
+EventoProgreso = namedtuple("EventoProgreso", [
+    "hechos",     # Filas del Excel ya procesadas (bien, con error o saltadas)
+    "total",      # Filas del Excel (estimado al abrirlo) o None si no se sabe
+    "errores",
+    "filas_s",    # Media móvil de filas por segundo
+    "eta_s",      # Segundos que faltan al ritmo actual (None si no se puede calcular)
+    "terminado",
+])
+
+class Progreso:
+    """
+    Cuenta las filas de un trabajo y avisa a callback_progreso con un EventoProgreso
+    como mucho cada 'intervalo' segundos (y siempre al terminar), así que avanzar()
+    se puede llamar en cada fila sin coste. filas_s es la media de los últimos
+    'ventana' segundos: refleja el ritmo actual aunque al principio se salten filas.
+    Se usa desde un único hilo (el que recoge los resultados).
+    """
+    def __init__(self, callback_progreso=None, total=None, intervalo=0.25, ventana=30.0):
+        self.callback = callback_progreso
+        self.total = total if total and total > 0 else None
+        self.intervalo = intervalo
+        self.ventana = ventana
+        self.hechos = 0
+        self.errores = 0
+        inicio = time.monotonic()
+        self._muestras = deque([(inicio, 0)])  # (instante, hechos) para la media móvil
+        self._siguiente_aviso = inicio
+
+    def avanzar(self, n=1, errores=0):
+        self.hechos += n
+        self.errores += errores
+        if self.callback is None:
+            return
+        ahora = time.monotonic()
+        if ahora >= self._siguiente_aviso:
+            self._siguiente_aviso = ahora + self.intervalo
+            self.callback(self._evento(ahora, False))
+
+    def terminar(self):
+        if self.callback is not None:
+            self.callback(self._evento(time.monotonic(), True))
+
+    def _evento(self, ahora, terminado):
+        self._muestras.append((ahora, self.hechos))
+        while len(self._muestras) > 2 and ahora - self._muestras[1][0] >= self.ventana:
+            self._muestras.popleft()
+        t0, hechos0 = self._muestras[0]
+        filas_s = (self.hechos - hechos0) / (ahora - t0) if ahora > t0 else 0.0
+
+        # El total es una estimación (filas de la hoja): nunca por debajo de lo ya hecho
+        total = max(self.total, self.hechos) if self.total else None
+        if terminado:
+            total = self.hechos
+        eta_s = (total - self.hechos) / filas_s if total and filas_s > 0 else None
+        return EventoProgreso(self.hechos, total, self.errores, filas_s, eta_s, terminado)
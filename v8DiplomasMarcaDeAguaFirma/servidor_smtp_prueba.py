@@ -0,0 +1,105 @@
+import asyncio
+import os
+import sys
+
+# Servidor SMTP local de pruebas: acepta cualquier usuario/contraseña y cualquier
+# destinatario, no envía nada a Internet. Sirve para probar los motores de envío
+# de mailer.py sin tocar una cuenta real.
+#
+#   python servidor_smtp_prueba.py [puerto] [carpeta_para_guardar_emails]
+#
+# En la aplicación: SMTP manual, servidor 127.0.0.1 y el puerto elegido (sin TLS).
+
+class ServidorSMTPPrueba:
+    def __init__(self, host="127.0.0.1", puerto=2525, carpeta=None, cortar_cada=0):
+        self.host = host
+        self.puerto = puerto
+        self.carpeta = carpeta
+        # Si es > 0, cada 'cortar_cada' MAIL FROM se cierra la conexión sin responder
+        # (simula un servidor que tira las conexiones, para probar la reconexión)
+        self.cortar_cada = cortar_cada
+        self.recibidos = 0
+        self.bytes_recibidos = 0
+        self._mails = 0
+        self._server = None
+
+    async def _atender(self, reader, writer):
+        async def responder(linea):
+            writer.write(linea.encode("ascii") + b"\r\n")
+            await writer.drain()
+
+        await responder("220 servidor-smtp-prueba")
+        try:
+            while True:
+                linea = await reader.readline()
+                if not linea:
+                    break
+                comando = linea.decode("utf-8", "replace").strip()
+                verbo = comando[:4].upper()
+
+                if verbo == "EHLO":
+                    await responder("250-servidor-smtp-prueba")
+                    await responder("250-8BITMIME")
+                    await responder("250 AUTH PLAIN")
+                elif verbo == "AUTH":
+                    if len(comando.split()) < 3:
+                        # AUTH PLAIN sin respuesta inicial: pedimos las credenciales
+                        await responder("334 ")
+                        await reader.readline()
+                    await responder("235 Autenticado")
+                elif verbo == "DATA":
+                    await responder("354 Termina con <CRLF>.<CRLF>")
+                    datos = []
+                    while True:
+                        linea = await reader.readline()
+                        if not linea or linea == b".\r\n":
+                            break
+                        datos.append(linea)
+                    self._guardar(b"".join(datos))
+                    await responder("250 OK")
+                elif verbo == "MAIL" and self.cortar_cada:
+                    self._mails += 1
+                    if self._mails % self.cortar_cada == 0:
+                        break
+                    await responder("250 OK")
+                elif verbo == "QUIT":
+                    await responder("221 Adios")
+                    break
+                else:
+                    # HELO, MAIL, RCPT, RSET, NOOP...
+                    await responder("250 OK")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _guardar(self, mensaje):
+        self.recibidos += 1
+        self.bytes_recibidos += len(mensaje)
+        if self.carpeta:
+            os.makedirs(self.carpeta, exist_ok=True)
+            with open(os.path.join(self.carpeta, f"email_{self.recibidos:06d}.eml"), "wb") as f:
+                f.write(mensaje)
+
+    async def iniciar(self):
+        self._server = await asyncio.start_server(self._atender, self.host, self.puerto)
+        self.puerto = self._server.sockets[0].getsockname()[1]  # Por si se pidió el puerto 0
+        return self
+
+    async def detener(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def servir(self):
+        await self.iniciar()
+        print(f"📭 Servidor SMTP de prueba en {self.host}:{self.puerto} (Ctrl+C para salir)")
+        async with self._server:
+            await self._server.serve_forever()
+
+if __name__ == "__main__":
+    puerto = int(sys.argv[1]) if len(sys.argv) > 1 else 2525
+    carpeta = sys.argv[2] if len(sys.argv) > 2 else None
+    try:
+        asyncio.run(ServidorSMTPPrueba(puerto=puerto, carpeta=carpeta).servir())
+    except KeyboardInterrupt:
+        pass
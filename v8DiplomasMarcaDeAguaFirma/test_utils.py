@@ -0,0 +1,40 @@
+import re
+import zipfile
+
+from openpyxl import Workbook
+
+from utils import FilasExcel
+
+COLUMNAS = ["email", "nombre", "apellido1", "curso_nombre", "id_plantilla"]
+
+def _excel_con_dimension(ruta, filas, dimension):
+    """Excel con 'filas' de datos cuya hoja declara otra <dimension> (como guardan algunos programas)"""
+    libro = Workbook()
+    hoja = libro.active
+    hoja.append(COLUMNAS)
+    for n in range(filas):
+        hoja.append([f"al{n}@ubu.es", f"Nombre {n}", "Apellido", "Curso", "default"])
+    libro.save(ruta)
+
+    # Reescribir el .xlsx cambiando la dimensión de la hoja
+    with zipfile.ZipFile(ruta) as origen:
+        contenido = {nombre: origen.read(nombre) for nombre in origen.namelist()}
+    xml = contenido["xl/worksheets/sheet1.xml"].decode("utf-8")
+    contenido["xl/worksheets/sheet1.xml"] = re.sub(r'<dimension ref="[^"]*"', f'<dimension ref="{dimension}"', xml).encode("utf-8")
+    with zipfile.ZipFile(ruta, "w", zipfile.ZIP_DEFLATED) as destino:
+        for nombre, datos in contenido.items():
+            destino.writestr(nombre, datos)
+
+def test_filas_excel_ignora_dimension_desfasada(tmp_path):
+    ruta = tmp_path / "alumnos.xlsx"
+    _excel_con_dimension(ruta, 200, "A1:C10")
+
+    lector = FilasExcel(str(ruta))
+    filas = list(lector)
+
+    assert lector.columnas == COLUMNAS
+    assert len(filas) == 200
+    assert filas[-1] == (199, {"email": "al199@ubu.es", "nombre": "Nombre 199", "apellido1": "Apellido",
+                               "curso_nombre": "Curso", "id_plantilla": "default"})
+    # La dimensión declarada solo se usa como estimación para el progreso
+    assert lector.total_estimado == 9
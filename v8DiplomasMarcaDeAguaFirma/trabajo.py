@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import multiprocessing
+
+# Control de un trabajo largo (generar o enviar) desde otro hilo: la interfaz o la
+# línea de comandos piden pausa / cancelación y el generador y el mailer lo respetan
+# entre fila y fila. Lo ya hecho queda registrado (manifiesto, diario de envíos), así
+# que al relanzar en modo incremental / reanudar se continúa donde se paró.
+
+class ControlTrabajo:
+    def __init__(self):
+        self._cancelado = threading.Event()
+        self._en_marcha = threading.Event()  # Sin marcar = en pausa
+        self._en_marcha.set()
+        self._procesos = None                # (cancelado, en_marcha) como multiprocessing.Event para los pools
+        self._lock = threading.Lock()
+
+    @property
+    def cancelado(self):
+        return self._cancelado.is_set()
+
+    @property
+    def pausado(self):
+        return not self._en_marcha.is_set()
+
+    def cancelar(self):
+        with self._lock:
+            self._cancelado.set()
+            self._en_marcha.set()  # Si estaba en pausa, que despierte para terminar
+            self._copiar_a_procesos()
+
+    def pausar(self):
+        with self._lock:
+            if not self.cancelado:
+                self._en_marcha.clear()
+                self._copiar_a_procesos()
+
+    def reanudar(self):
+        with self._lock:
+            self._en_marcha.set()
+            self._copiar_a_procesos()
+
+    def _copiar_a_procesos(self):
+        if self._procesos is None:
+            return
+        cancelado, en_marcha = self._procesos
+        if self.cancelado:
+            cancelado.set()
+        if self.pausado:
+            en_marcha.clear()
+        else:
+            en_marcha.set()
+
+    def seguir(self):
+        """Punto de control entre filas: espera mientras esté en pausa. False si hay que parar"""
+        self._en_marcha.wait()
+        return not self.cancelado
+
+    async def seguir_async(self):
+        """Igual que seguir() pero sin bloquear el bucle de asyncio"""
+        while not self._en_marcha.is_set():
+            await asyncio.sleep(0.2)
+        return not self.cancelado
+
+    def filas(self, filas):
+        """Deja pasar filas mientras no se cancele (y se queda esperando si está en pausa)"""
+        for fila in filas:
+            if not self.seguir():
+                return
+            yield fila
+
+    def eventos_procesos(self):
+        """
+        (cancelado, en_marcha) como multiprocessing.Event, para pasarlos a los procesos
+        de un pool (initargs): así también se paran o esperan a media tarea
+        """
+        with self._lock:
+            if self._procesos is None:
+                self._procesos = (multiprocessing.Event(), multiprocessing.Event())
+                self._copiar_a_procesos()
+            return self._procesos
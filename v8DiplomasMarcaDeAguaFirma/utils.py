@@ -1,12 +1,13 @@
 import os
 import sys
 import re
-import pandas as pd
 import json
 import unicodedata
-from cryptography.hazmat.primitives.serialization import pkcs12
-from cryptography.hazmat.primitives import serialization
-from cryptography.x509.oid import NameOID
+from collections import namedtuple
+from manifiesto import leer_manifiesto
+
+# pandas se importa dentro de las funciones que lo usan: importar utils (y con él
+# mailer, o la interfaz) no tiene que cargarlo hasta que se lee el primer Excel.
 
 def obtener_ruta_plantillas():
     """Devuelve la ruta de la carpeta 'plantillas' junto al ejecutable"""
@@ -22,17 +23,31 @@ def obtener_ruta_plantillas():
         os.makedirs(ruta) # Crear si no existe para evitar errores
     return ruta
 
-def cargar_configuracion_plantilla(nombre_plantilla):
+# Registro de plantillas ya resueltas: nombre -> (carpeta, marca, config, ruta_fondo)
+_CACHE_PLANTILLAS = {}
+
+def limpiar_cache_plantillas():
+    """Olvida las plantillas resueltas (se llama al empezar cada ejecución)"""
+    _CACHE_PLANTILLAS.clear()
+
+def _marca_plantilla(carpeta_tema):
+    """Fecha de modificación de la carpeta y de su config.json (None si no existen)"""
+    try:
+        marca_carpeta = os.stat(carpeta_tema).st_mtime_ns
+    except OSError:
+        return None
+    try:
+        marca_json = os.stat(os.path.join(carpeta_tema, "config.json")).st_mtime_ns
+    except OSError:
+        marca_json = None
+    return marca_carpeta, marca_json
+
+def _resolver_carpeta_plantilla(nombre_plantilla):
     """
     Busca la plantilla en este orden:
     1. Carpeta 'plantillas' junto al EXE (Personalizadas por el usuario).
     2. Carpeta 'plantillas' dentro del EXE (Integradas de fábrica).
     """
-    if not nombre_plantilla or pd.isna(nombre_plantilla):
-        nombre_plantilla = "default"
-    
-    nombre_plantilla = str(nombre_plantilla).strip()
-    
     # Rutas posibles
     # A) Externa (Junto al .exe)
     if getattr(sys, 'frozen', False):
@@ -46,19 +61,19 @@ def cargar_configuracion_plantilla(nombre_plantilla):
     ruta_interna = resource_path(os.path.join("plantillas", nombre_plantilla))
     
     # Decisión: ¿Cual usamos?
-    carpeta_tema = None
-    
     if os.path.exists(ruta_externa):
         # Prioridad 1: El usuario ha creado una carpeta fuera
-        carpeta_tema = ruta_externa
+        return ruta_externa
     elif os.path.exists(ruta_interna):
         # Prioridad 2: Usamos la que viene dentro del EXE
-        carpeta_tema = ruta_interna
+        return ruta_interna
     else:
         # Fallback: Si no existe la pedida, intentamos buscar 'default' interna
         print(f"⚠️ Plantilla '{nombre_plantilla}' no encontrada. Usando default.")
-        carpeta_tema = resource_path(os.path.join("plantillas", "default"))
+        return resource_path(os.path.join("plantillas", "default"))
 
+def _leer_plantilla(carpeta_tema):
+    """Lee config.json y localiza la imagen de fondo de una carpeta de plantilla"""
     # Cargar Config
     ruta_json = os.path.join(carpeta_tema, "config.json")
     
@@ -81,6 +96,38 @@ def cargar_configuracion_plantilla(nombre_plantilla):
 
     return config, ruta_fondo
 
+def cargar_plantilla(nombre_plantilla):
+    """
+    Devuelve (carpeta, marca, config, ruta_fondo) de la plantilla pedida.
+    La carpeta se resuelve una sola vez por ejecución y el config.json se
+    vuelve a leer únicamente si la carpeta o el JSON cambian de fecha
+    (la marca son esas dos fechas).
+    """
+    import pandas as pd
+
+    if not nombre_plantilla or pd.isna(nombre_plantilla):
+        nombre_plantilla = "default"
+    
+    nombre_plantilla = str(nombre_plantilla).strip()
+
+    cacheada = _CACHE_PLANTILLAS.get(nombre_plantilla)
+    if cacheada:
+        carpeta_tema, marca, config, ruta_fondo = cacheada
+        if _marca_plantilla(carpeta_tema) == marca:
+            return cacheada
+    else:
+        carpeta_tema = _resolver_carpeta_plantilla(nombre_plantilla)
+
+    marca = _marca_plantilla(carpeta_tema)
+    config, ruta_fondo = _leer_plantilla(carpeta_tema)
+    _CACHE_PLANTILLAS[nombre_plantilla] = (carpeta_tema, marca, config, ruta_fondo)
+    return _CACHE_PLANTILLAS[nombre_plantilla]
+
+def cargar_configuracion_plantilla(nombre_plantilla):
+    """Devuelve (config, ruta_fondo) de la plantilla pedida (ver cargar_plantilla)"""
+    _, _, config, ruta_fondo = cargar_plantilla(nombre_plantilla)
+    return config, ruta_fondo
+
 def resource_path(relative_path):
     """Ruta absoluta para recursos, compatible con PyInstaller"""
     try:
@@ -89,7 +136,121 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+class FilasExcel:
+    """
+    Fuente de filas del Excel en streaming (openpyxl en modo solo lectura).
+    Los nombres de columna se normalizan una vez (minúsculas y sin espacios) y
+    al iterar se obtienen tuplas (i, fila), donde 'fila' es un dict columna -> valor
+    e 'i' sigue la numeración de pandas (fila de Excel = i + 2).
+    Las celdas vacías valen None y las filas completamente vacías se saltan.
+    """
+    def __init__(self, ruta_excel):
+        from openpyxl import load_workbook
+
+        self.ruta = ruta_excel
+        self._libro = load_workbook(ruta_excel, read_only=True, data_only=True)
+        self._hoja = self._libro.active
+
+        # Filas de datos según la dimensión guardada en la hoja (incluye las vacías);
+        # None si el archivo no la declara. Solo sirve para estimar el progreso: hay
+        # programas que la guardan mal, así que para leer se descarta (como hace pandas)
+        # y se recorre la hoja entera
+        max_row = self._hoja.max_row
+        self.total_estimado = max_row - 1 if max_row and max_row > 1 else None
+        self._hoja.reset_dimensions()
+
+        cabecera = next(self._hoja.iter_rows(max_row=1, values_only=True), ())
+        # (posición, nombre) de las columnas con cabecera
+        self._posiciones = [(n, str(c).lower().strip()) for n, c in enumerate(cabecera) if c is not None]
+        self.columnas = [nombre for _, nombre in self._posiciones]
+
+    def __iter__(self):
+        try:
+            for i, valores in enumerate(self._hoja.iter_rows(min_row=2, values_only=True)):
+                if not any(v is not None for v in valores):
+                    continue
+                fila = {nombre: (valores[n] if n < len(valores) else None) for n, nombre in self._posiciones}
+                yield i, fila
+        finally:
+            self.cerrar()
+
+    def cerrar(self):
+        self._libro.close()
+
+# Fila ya preparada para renderizar / enviar (tupla ligera, se puede mandar a otro proceso)
+FilaPreparada = namedtuple("FilaPreparada", [
+    "i",                # Numeración de pandas (fila de Excel = i + 2)
+    "datos",            # Dict original columna -> valor
+    "email",
+    "nombre",
+    "nombre_completo",  # "NOMBRE APELLIDO1 APELLIDO2"
+    "curso",
+    "email_id",         # email_a_id(email)
+    "curso_id",         # limpiar_nombre_curso(curso)
+    "archivo",          # "<email_id>__<curso_id>.pdf"
+    "valida",           # El email contiene '@'
+])
+
+# Filas que se preparan de golpe con pandas
+TAMANO_BLOQUE = 1000
+
+def _columna_texto(df, columna):
+    """Versión vectorizada de texto_seguro para una columna (vacía si no existe)"""
+    import pandas as pd
+
+    if columna not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    serie = df[columna]
+    return serie.where(serie.notna(), "").astype(str).str.strip()
+
+def _preparar_bloque(bloque):
+    import pandas as pd
+
+    df = pd.DataFrame([fila for _, fila in bloque], dtype=object)
+
+    email = _columna_texto(df, "email")
+    nombre = _columna_texto(df, "nombre")
+    curso = _columna_texto(df, "curso_nombre")
+
+    nombre_completo = (nombre + " " + _columna_texto(df, "apellido1") + " " + _columna_texto(df, "apellido2")).str.strip().str.upper()
+
+    # email_a_id
+    email_id = email.str.lower().str.strip().str.replace("@", "_", regex=False).str.replace(".", "_", regex=False)
+
+    # limpiar_nombre_curso
+    curso_id = (curso.str.normalize("NFD").str.encode("ascii", "ignore").str.decode("utf-8")
+                .str.replace(r"[^a-zA-Z0-9]", "_", regex=True)
+                .str.replace(r"_+", "_", regex=True)
+                .str.slice(0, 50))
+    curso_id = curso_id.where(curso != "", "diploma")
+
+    archivo = email_id + "__" + curso_id + ".pdf"
+    valida = email.str.contains("@", regex=False)
+
+    return [FilaPreparada(*campos) for campos in zip(
+        [i for i, _ in bloque], [fila for _, fila in bloque],
+        email.tolist(), nombre.tolist(), nombre_completo.tolist(), curso.tolist(),
+        email_id.tolist(), curso_id.tolist(), archivo.tolist(), valida.tolist())]
+
+def preparar_filas(filas, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Calcula de una pasada (con operaciones vectorizadas de pandas, por bloques)
+    los campos derivados de cada fila: nombre completo, ids de email y curso,
+    nombre del PDF y validez del email. Recibe tuplas (i, fila) como las de
+    FilasExcel y devuelve FilaPreparada en el mismo orden.
+    """
+    bloque = []
+    for i, fila in filas:
+        bloque.append((i, fila))
+        if len(bloque) >= tamano_bloque:
+            yield from _preparar_bloque(bloque)
+            bloque = []
+    if bloque:
+        yield from _preparar_bloque(bloque)
+
 def texto_seguro(valor):
+    import pandas as pd
+
     if pd.isna(valor):
         return ""
     return str(valor).strip()
@@ -98,6 +259,8 @@ def email_a_id(email):
     return email.lower().strip().replace("@", "_").replace(".", "_")
 
 def parse_calificacion(valor):
+    import pandas as pd
+
     if pd.isna(valor):
         return None
     s = str(valor).replace(",", ".")
@@ -109,25 +272,103 @@ def parse_calificacion(valor):
         return None
     return None
 
-def buscar_pdf_correcto(carpeta, email_id):
-    """Busca el PDF más reciente que empiece por el email_id"""
-    if not os.path.exists(carpeta):
-        return None
+class IndicePDFs:
+    """
+    Índice de una carpeta de diplomas.
+    Los PDFs se llaman '<email_id>__<curso_id>.pdf', así que cada archivo se indexa
+    por su nombre completo (lo que se busca es exactamente '<email_id>__<curso_id>')
+    y por email_id, quedándonos siempre con el más reciente. Las búsquedas son O(1).
+    Si la carpeta tiene manifiesto del generador se usa directamente (sin escanear
+    la carpeta) y el email_id sale de su campo 'email'; si no, se escanea una única vez.
+    El manifiesto puede haberse quedado atrás (PDFs borrados, añadidos o renombrados a
+    mano): cada acierto se comprueba en disco y, ante un fallo, se escanea la carpeta
+    una vez y a partir de ahí manda lo que hay en disco.
+    """
+    # email_id termina en letra o número (el dominio); curso_id puede empezar por '_'
+    # ('(Online) Python' -> '_Online_Python'), así que el corte es el último '__'
+    # que va detrás de algo que no sea '_'
+    _NOMBRE = re.compile(r"^(.*[^_])__(.*)$")
+
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        self._por_clave = {}  # '<email_id>__<curso_id>' en minúsculas -> (orden, ruta)
+        self._por_email = {}  # email_id -> (orden, ruta)
+        self.desde_manifiesto = False
+        self._escaneado = False
+
+        if not os.path.isdir(carpeta):
+            return
+
+        entradas = leer_manifiesto(carpeta)
+        if entradas:
+            self.desde_manifiesto = True
+            # La fecha ISO del manifiesto ordena igual que un mtime
+            for archivo, entrada in entradas.items():
+                email = entrada.get("email")
+                self.anadir(os.path.join(carpeta, archivo), entrada.get("fecha", ""),
+                            email_a_id(email) if email else None)
+            return
 
-    candidatos = []
-    for f in os.listdir(carpeta):
-        if not f.lower().endswith(".pdf"):
-            continue
-        if f.startswith(email_id):
-            ruta = os.path.join(carpeta, f)
-            candidatos.append(ruta)
+        self._escanear()
 
-    if not candidatos:
+    def _escanear(self):
+        """Indexa lo que hay en la carpeta (sustituye lo que viniera del manifiesto)"""
+        self._escaneado = True
+        self._por_clave.clear()
+        self._por_email.clear()
+        with os.scandir(self.carpeta) as entradas:
+            for entrada in entradas:
+                nombre = entrada.name.lower()
+                if not nombre.endswith(".pdf") or not entrada.is_file():
+                    continue
+                self.anadir(entrada.path, entrada.stat().st_mtime)
+
+    def _consultar(self, tabla, clave):
+        """Ruta indexada para esa clave si el archivo sigue en disco; si no, reintenta tras escanear"""
+        encontrado = tabla.get(clave)
+        if encontrado and (not self.desde_manifiesto or os.path.exists(encontrado[1])):
+            return encontrado[1]
+        if self.desde_manifiesto and not self._escaneado and os.path.isdir(self.carpeta):
+            self._escanear()
+            encontrado = tabla.get(clave)
+            return encontrado[1] if encontrado else None
         return None
 
-    # Ordenar por fecha de modificación (el más nuevo primero)
-    candidatos.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-    return candidatos[0]
+    @staticmethod
+    def _guardar(tabla, clave, orden, ruta):
+        actual = tabla.get(clave)
+        if actual is None or orden >= actual[0]:
+            tabla[clave] = (orden, ruta)
+
+    def anadir(self, ruta, orden=0, email_id=None):
+        """
+        Registra un PDF en el índice. 'orden' es su mtime (o la fecha del manifiesto):
+        si la clave se repite gana el más reciente. Sin email_id se deduce del nombre.
+        """
+        base = os.path.basename(ruta).lower()[:-len(".pdf")]
+        self._guardar(self._por_clave, base, orden, ruta)
+        if email_id is None:
+            partes = self._NOMBRE.match(base)
+            # Nombre antiguo sin curso: '<email_id>.pdf'
+            email_id = partes.group(1) if partes else base
+        self._guardar(self._por_email, email_id.lower(), orden, ruta)
+
+    def buscar(self, email_id, curso_id):
+        """PDF más reciente de ese alumno y ese curso (o None)"""
+        return self._consultar(self._por_clave, f"{email_id}__{curso_id}".lower())
+
+    def buscar_por_email(self, email_id):
+        """PDF más reciente de ese alumno, sea del curso que sea (o None)"""
+        return self._consultar(self._por_email, email_id.lower())
+
+def buscar_pdf_correcto(carpeta, email_id, indice=None):
+    """
+    Busca el PDF más reciente del email_id.
+    Si se hacen muchas búsquedas, pasar un IndicePDFs ya construido (un solo escaneo).
+    """
+    if indice is None:
+        indice = IndicePDFs(carpeta)
+    return indice.buscar_por_email(email_id)
 
 def abrir_archivo(ruta):
     """Abre el archivo con el programa predeterminado del sistema (Windows/Mac/Linux)"""
@@ -174,32 +415,15 @@ def obtener_nombre_del_pfx(ruta_pfx, password):
     """
     Abre un archivo .pfx y extrae el 'Common Name' (Nombre y Apellidos) del propietario.
     Devuelve un string (ej: 'FELIX DE MIGUEL') o None si falla.
+    El certificado queda cargado en firmador, así que la firma posterior no lo vuelve a leer.
     """
     if not os.path.exists(ruta_pfx):
         return None
 
     try:
-        with open(ruta_pfx, "rb") as f:
-            pfx_data = f.read()
-
-        # Cargar el PFX
-        private_key, certificate, additional_certificates = pkcs12.load_key_and_certificates(
-            pfx_data, 
-            password.encode("utf-8") if password else None
-        )
-
-        # Extraer el sujeto (Subject) del certificado
-        subject = certificate.subject
-        
-        # Buscar el campo "Common Name" (CN)
-        # Esto suele devolver una lista, cogemos el primero
-        common_names = subject.get_attributes_for_oid(NameOID.COMMON_NAME)
-        
-        if common_names:
-            return common_names[0].value
-        else:
-            return "Firma Digital Verificada" # Fallback si no tiene CN
+        import firmador
+        return firmador.obtener_sesion(ruta_pfx, password).nombre_firmante
             
     except Exception as e:
         print(f"Error leyendo PFX: {e}")
-        return None
\ No newline at end of file
+        return None